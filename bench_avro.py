@@ -0,0 +1,103 @@
+# Avro 编解码基准测试：对比 Avro 类逐字段写出与 AvroEncoder 批量编码文件列表的耗时
+# 用法: python bench_avro.py [记录数量]
+import sys
+import time
+import random
+
+from core.types import Avro, AvroEncoder, AvroDecoder
+
+
+def make_files(count: int) -> list:
+    rng = random.Random(0)
+    return [
+        {
+            "HASH": "%040x" % rng.getrandbits(160),
+            "SOURCE": "local",
+            "SIZE": rng.randint(0, 64 * 1024 * 1024),
+            "MTIME": rng.randint(1600000000000, 1800000000000),
+        }
+        for _ in range(count)
+    ]
+
+
+# 旧实现：Avro 类逐字节写入 BytesIO
+def avro(files: list) -> bytes:
+    writer = Avro()
+    writer.writeVarInt(len(files))
+    for file in files:
+        writer.writeString(f"/{file['SOURCE']}/{file['HASH']}")
+        writer.writeString(file["HASH"])
+        writer.writeVarInt(file["SIZE"])
+        writer.writeVarInt(file["MTIME"])
+    writer.writeVarInt(0)
+    return writer.io.getvalue()
+
+
+# 新实现：与 FileListStream 相同，按块批量编码
+def encoder(files: list, chunk_size: int = 10000) -> bytes:
+    writer = AvroEncoder()
+    writer.writeVarInt(len(files))
+    parts = []
+    for i in range(0, len(files), chunk_size):
+        writer.writeFiles(files[i : i + chunk_size])
+        parts.append(writer.flush())
+    writer.writeVarInt(0)
+    parts.append(writer.flush())
+    return b"".join(parts)
+
+
+# 两种解码都生成相同的记录字典，便于公平比较
+def avro_decode(data: bytes) -> list:
+    reader = Avro(data)
+    files = []
+    while remaining := reader.readVarInt():
+        for _ in range(remaining):
+            files.append(
+                {
+                    "path": reader.readString(),
+                    "hash": reader.readString(),
+                    "size": reader.readVarInt(),
+                    "mtime": reader.readVarInt(),
+                }
+            )
+    return files
+
+
+def decoder_decode(data: bytes, chunk_size: int = 256 * 1024) -> list:
+    reader = AvroDecoder()
+    files = []
+    for i in range(0, len(data), chunk_size):
+        reader.feed(data[i : i + chunk_size])
+        files.extend(reader.files())
+    return files
+
+
+# 取多次运行中最快的一次，减少机器负载波动的影响
+def measure(name: str, func, *args, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return name, best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    files = make_files(count)
+    print(f"{count} 条文件记录")
+    results = [measure("Avro 编码", avro, files), measure("AvroEncoder 编码", encoder, files)]
+    assert results[0][2] == results[1][2], "编码结果不一致"
+    data = results[1][2]
+    print(f"编码结果 {len(data) / 1024 / 1024:.1f} MiB")
+    results.append(measure("Avro 解码", avro_decode, data))
+    results.append(measure("AvroDecoder 分块解码", decoder_decode, data))
+    assert results[2][2] == results[3][2] and len(results[3][2]) == count, "解码结果不一致"
+    for i, (name, elapsed, _) in enumerate(results):
+        speedup = results[i - i % 2][1] / elapsed
+        print(f"{name:<20} {elapsed:7.2f}s {count / elapsed:10.0f} 条/秒 {speedup:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
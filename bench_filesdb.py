@@ -0,0 +1,97 @@
+# FILELIST 查询基准测试：在临时数据库中写入大量记录，对比无索引全表扫描与
+# 通过连接池按 PATH / HASH 索引查询的延迟，以及元数据缓存命中时的开销
+# 用法: python bench_filesdb.py [记录数量] [查询次数]
+import os
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import statistics
+import tempfile
+
+from core.filesdb import FilesDB, FilesDBPool, filemeta_cache
+
+
+def make_files(count: int):
+    for i in range(count):
+        yield {
+            "hash": "%040x" % i,
+            "path": f"/{i % 256:02x}/{i}.jar",
+            "url": "",
+            "size": i,
+            "mtime": 1600000000000 + i,
+            "source": "local",
+        }
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{name:<28} 平均 {statistics.mean(samples) * 1000:8.3f}ms "
+        f"p50 {statistics.median(samples) * 1000:8.3f}ms p99 {p99 * 1000:8.3f}ms"
+    )
+
+
+# 同步 sqlite3 直接查询，NOT INDEXED 强制全表扫描，用于对比迁移前的情况
+def scan(path: str, keys: list, column: str, indexed: bool) -> list:
+    conn = sqlite3.connect(path)
+    sql = f"SELECT * FROM FILELIST {'' if indexed else 'NOT INDEXED '}WHERE {column} = ?"
+    samples = []
+    for key in keys:
+        start = time.perf_counter()
+        assert conn.execute(sql, (key,)).fetchone() is not None
+        samples.append(time.perf_counter() - start)
+    conn.close()
+    return samples
+
+
+async def lookup(func, keys: list) -> list:
+    samples = []
+    for key in keys:
+        start = time.perf_counter()
+        assert await func(key)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def run(path: str, count: int, queries: int):
+    pool = FilesDBPool(path)
+    filesdb = FilesDB(pool)
+    await filesdb.connect()
+    start = time.perf_counter()
+    await filesdb.insert_many(make_files(count), batch_size=50000)
+    print(f"写入 {count} 条记录，耗时 {time.perf_counter() - start:.1f}s")
+    rng = random.Random(0)
+    ids = [rng.randrange(count) for _ in range(queries)]
+    paths = [f"/{i % 256:02x}/{i}.jar" for i in ids]
+    hashes = ["%040x" % i for i in ids]
+    # 全表扫描很慢，只取少量样本
+    report("PATH 全表扫描", await asyncio.to_thread(scan, path, paths[:20], "PATH", False))
+    report("PATH 索引（sqlite3）", await asyncio.to_thread(scan, path, paths, "PATH", True))
+    report("HASH 主键（sqlite3）", await asyncio.to_thread(scan, path, hashes, "HASH", True))
+    filemeta_cache.clear()
+    report("find_by_path 未命中缓存", await lookup(filesdb.find_by_path, paths))
+    report("find_by_path 命中缓存", await lookup(filesdb.find_by_path, paths))
+    report("find_by_hash", await lookup(filesdb.find_by_hash, hashes))
+    # 并发查询，考察多个只读连接的吞吐
+    filemeta_cache.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*[filesdb.find_by_hash(hash) for hash in hashes])
+    elapsed = time.perf_counter() - start
+    print(f"{'并发 find_by_hash':<28} {queries / elapsed:8.0f} 次/秒")
+    await pool.close()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "bench.db")
+        open(path, "wb").close()
+        asyncio.run(run(path, count, queries))
+
+
+if __name__ == "__main__":
+    main()
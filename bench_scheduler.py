@@ -0,0 +1,152 @@
+# 节点调度仿真：用合成流量回放重定向，比较各调度策略下的负载均衡程度
+# 节点的声明带宽与实际容量不一致，负载信息只能通过周期性的 keep-alive 上报获得
+# 用法: python bench_scheduler.py [节点数量] [仿真时长（秒）] [负载率]
+import sys
+import time
+import random
+import statistics
+from collections import deque
+from contextlib import contextmanager
+
+import core.types as types
+from core.types import Cluster, OCLManager, WRRScheduler, HashRing, LoadTracker
+
+POLICIES = ("random", "wrr", "p2c", "hash")
+KEEPALIVE = 60  # keep-alive 上报间隔（秒）
+WINDOW = 300  # 吞吐量统计窗口（秒）
+MEAN_SIZE = 2 * 1024 * 1024  # 平均文件大小（字节）
+
+
+# 仿真时钟，注入 LoadTracker 代替 time.monotonic
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class Node:
+    def __init__(self, cluster: Cluster, capacity: float):
+        self.cluster = cluster
+        self.capacity = capacity  # 实际容量（字节/秒）
+        self.queue = deque()  # 排队中的请求剩余字节数，按先后顺序发送
+        self.backlog = 0.0  # 尚未发送完的字节数
+        self.assigned = 0  # 分配到的字节数
+        self.hits = 0  # 上次上报后发送完成的请求数
+        self.served = 0.0  # 上次上报后发送的字节数
+        self.max_delay = 0.0  # 最大排队时间（秒）
+
+
+# 声明带宽在 50-500Mbps 之间，实际容量为声明值的 0.3-1.5 倍，
+# 一半节点有测量带宽（接近实际容量），其余只有声明值
+def make_nodes(count: int, rng: random.Random) -> list:
+    nodes = []
+    for i in range(count):
+        cluster = Cluster(f"node-{i}")
+        cluster.bandwidth = rng.randint(50, 500)
+        actual = cluster.bandwidth * rng.uniform(0.3, 1.5)
+        cluster.measureBandwidth = int(actual * rng.uniform(0.9, 1.1)) if i % 2 else 0
+        cluster.trust = 0
+        cluster.weight = cluster.trust + cluster.bandwidth + cluster.measureBandwidth
+        nodes.append(Node(cluster, actual * 125000))
+    return nodes
+
+
+# OCLManager 使用 core.types 中的模块级调度状态，仿真期间临时替换为全新的实例，结束后恢复
+@contextmanager
+def scheduler_state(policy: str, clock: Clock):
+    names = ("scheduler_policy", "wrrs", "ring", "loads")
+    saved = {name: getattr(types, name) for name in names}
+    types.scheduler_policy = policy
+    types.wrrs = WRRScheduler()
+    types.ring = HashRing()
+    types.loads = LoadTracker(WINDOW, clock.monotonic)
+    try:
+        yield types.loads
+    finally:
+        for name, value in saved.items():
+            setattr(types, name, value)
+
+
+# 按容量发送一秒的数据，请求发送完成后才计入 hits，与节点上报的统计一致
+def send(node: Node):
+    budget = node.capacity
+    while node.queue and budget > 0:
+        sent = min(node.queue[0], budget)
+        node.queue[0] -= sent
+        budget -= sent
+        node.backlog -= sent
+        node.served += sent
+        if node.queue[0] <= 0:
+            node.queue.popleft()
+            node.hits += 1
+
+
+def simulate(policy: str, count: int, duration: int, utilization: float, seed: int = 0):
+    rng = random.Random(seed)
+    nodes = make_nodes(count, rng)
+    by_id = {node.cluster.id: node for node in nodes}
+    clock = Clock()
+    random_state = random.getstate()
+    random.seed(seed + 1)  # OCLManager.choice 使用全局 random
+    try:
+        with scheduler_state(policy, clock) as loads:
+            manager = OCLManager()
+            for node in nodes:
+                manager.append(node.cluster)
+            capacity = sum(node.capacity for node in nodes)
+            rate = capacity * utilization / MEAN_SIZE  # 每秒请求数
+            files = ["%040x" % rng.getrandbits(160) for _ in range(10000)]
+            weights = [1 / (i + 1) for i in range(len(files))]  # 文件热度服从 Zipf 分布
+            rng_select = random.Random(seed + 1)
+            start = time.perf_counter()
+            for second in range(duration):
+                clock.now = float(second)
+                requests = int(rate) + (rng_select.random() < rate - int(rate))
+                for hash in rng_select.choices(files, weights, k=requests):
+                    node = by_id[manager.select(hash).id]
+                    size = int(rng_select.expovariate(1 / MEAN_SIZE))
+                    node.queue.append(size)
+                    node.backlog += size
+                    node.assigned += size
+                for node in nodes:
+                    node.max_delay = max(node.max_delay, node.backlog / node.capacity)
+                    send(node)
+                    if second % KEEPALIVE == KEEPALIVE - 1:
+                        loads.record(node.cluster.id, node.hits, int(node.served))
+                        node.hits = 0
+                        node.served = 0
+    finally:
+        random.setstate(random_state)
+    elapsed = time.perf_counter() - start
+    ratios = [node.assigned / (node.capacity * duration) for node in nodes]
+    return {
+        "mean": statistics.mean(ratios),
+        "stdev": statistics.pstdev(ratios),
+        "max": max(ratios),
+        "overloaded": sum(ratio > 1 for ratio in ratios),
+        "delay": max(node.max_delay for node in nodes),
+        "cost": elapsed / max(rate * duration, 1) * 1e6,
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    duration = int(sys.argv[2]) if len(sys.argv) > 2 else 1800
+    utilization = float(sys.argv[3]) if len(sys.argv) > 3 else 0.7
+    print(f"{count} 个节点，仿真 {duration}s，目标负载率 {utilization:.0%}")
+    print(
+        f"{'策略':<8} {'平均负载率':>10} {'标准差':>8} {'最大负载率':>10} "
+        f"{'过载节点':>8} {'最大排队(s)':>11} {'选择(us)':>9}"
+    )
+    for policy in POLICIES:
+        r = simulate(policy, count, duration, utilization)
+        print(
+            f"{policy:<8} {r['mean']:10.3f} {r['stdev']:8.3f} {r['max']:10.3f} "
+            f"{r['overloaded']:8d} {r['delay']:11.1f} {r['cost']:9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
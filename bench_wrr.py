@@ -0,0 +1,111 @@
+# 加权轮询调度基准测试：对比旧的按权重重复入堆实现与当前步幅调度的公平性与开销
+# 用法: python bench_wrr.py [选择次数] [大规模测试的节点数量]
+import sys
+import time
+import heapq
+import random
+from collections import Counter
+
+from core.types import WRRScheduler
+
+
+# 旧实现（e0a08bb 之前的 core.types.WRRScheduler），每个服务器按权重放入多个堆条目
+class LegacyWRRScheduler:
+    def __init__(self):
+        self.servers = {}
+        self.queue = []
+
+    def add_server(self, server, weight):
+        self.servers[server] = weight
+        for _ in range(weight):
+            heapq.heappush(self.queue, (-weight, server))
+
+    def remove_server(self, server):
+        self.queue = [item for item in self.queue if item[1] != server]
+        del self.servers[server]
+
+    def update_weight(self, server, new_weight):
+        self.queue = [item for item in self.queue if item[1] != server]
+        self.servers[server] = new_weight
+        for _ in range(new_weight):
+            heapq.heappush(self.queue, (-new_weight, server))
+
+    def next_server(self):
+        if not self.queue:
+            return None
+        weight, server = heapq.heappop(self.queue)
+        heapq.heappush(self.queue, (weight + 1, server))
+        return server
+
+
+# 公平性：各服务器实际份额与权重份额的最大偏差（百分点）
+def max_deviation(picks: list, weights: dict) -> float:
+    counts = Counter(picks)
+    total = sum(weights.values())
+    return max(
+        abs(counts[server] / len(picks) - weight / total) * 100
+        for server, weight in weights.items()
+    )
+
+
+# 平滑性：同一服务器被连续选中的最长次数
+def longest_run(picks: list) -> int:
+    longest = run = 1
+    for previous, current in zip(picks, picks[1:]):
+        run = run + 1 if previous == current else 1
+        longest = max(longest, run)
+    return longest
+
+
+def run(scheduler_class, weights: dict, picks: int, updates: int):
+    scheduler = scheduler_class()
+    start = time.perf_counter()
+    for server, weight in weights.items():
+        scheduler.add_server(server, weight)
+    add_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = [scheduler.next_server() for _ in range(picks)]
+    pick_time = time.perf_counter() - start
+    servers = list(weights)
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(updates):
+        server = rng.choice(servers)
+        scheduler.update_weight(server, weights[server])  # 权重不变，只测开销
+    update_time = time.perf_counter() - start
+    return {
+        "add": add_time * 1000,
+        "pick": pick_time / picks * 1e6,
+        "update": update_time / updates * 1e6,
+        "deviation": max_deviation(result, weights),
+        "run": longest_run(result),
+        "entries": len(scheduler.queue),
+    }
+
+
+def report(title: str, weights: dict, picks: int, updates: int):
+    print(f"{title}: {len(weights)} 个节点，总权重 {sum(weights.values())}，{picks} 次选择")
+    print(
+        f"{'实现':<10} {'添加(ms)':>10} {'选择(us)':>10} {'更新(us)':>10} "
+        f"{'份额偏差(%)':>12} {'最长连续':>8} {'堆条目':>8}"
+    )
+    for name, scheduler_class in (("旧实现", LegacyWRRScheduler), ("步幅调度", WRRScheduler)):
+        r = run(scheduler_class, weights, picks, updates)
+        print(
+            f"{name:<10} {r['add']:10.2f} {r['pick']:10.2f} {r['update']:10.2f} "
+            f"{r['deviation']:12.3f} {r['run']:8d} {r['entries']:8d}"
+        )
+    print()
+
+
+def main():
+    picks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    report("固定权重", {"a": 5000, "b": 3000, "c": 1500, "d": 500}, picks, 100)
+    rng = random.Random(1)
+    weights = {f"node-{i}": rng.randint(1, 2000) for i in range(nodes)}
+    report("随机权重", weights, picks, 100)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,5 @@
 # 第三方库
 import re
-import time
-import pytz
 import asyncio
 import uvicorn
 import importlib
@@ -10,7 +8,6 @@ from fastapi import FastAPI, Response
 from datetime import datetime, timezone
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-from dateutil.relativedelta import relativedelta
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
@@ -18,14 +15,21 @@ import socketio
 from socketio.asgi import ASGIApp
 
 # 本地库
-from core.mdb import cdb
+from core.mdb import cdb, cluster_registry
 import core.const as const
 import core.utils as utils
 from core.logger import logger
 from core.config import config
-from core.types import Cluster, oclm
-from core.filesdb import FilesDB
-from core.dns.cloudflare import cf_client
+from core.types import Cluster, oclm, loads
+from core.filesdb import filesdb_pool
+from core.filelist import filelist
+from core.jobs import enable_queue
+from core.measure import measure_engine
+from core.prober import prober
+from core.sync import sync_pipeline
+from core.upstream import upstream_cache
+from core.dns.cloudflare import cf_client, dns_reconciler
+from core.dns.certificate import cert_service, cert_manager
 
 # 路由库
 from core.routes.agent import router as agent_router
@@ -39,9 +43,27 @@ async def lifespan(app: FastAPI):
     logger.info(
         f"正在 {config.get('host')}:{config.get('port')} 上监听服务器..."
     )
+    await filesdb_pool.open()
+    await cluster_registry.start()
+    await filelist.load()
+    await asyncio.to_thread(upstream_cache.load)
+    enable_queue.start()
+    if config.get("prober.enable", True):
+        prober.start()
+    cert_manager.start()
+    if config.get("git_repo.url") and config.get("sync.enable", True):
+        sync_pipeline.start()
     yield
-    async with FilesDB() as db:
-        await db.close()
+    await prober.stop()
+    await sync_pipeline.stop()
+    await cert_manager.stop()
+    await enable_queue.stop()
+    await measure_engine.close()
+    await upstream_cache.close()
+    await cf_client.close()
+    await cert_service.close()
+    await cluster_registry.stop()
+    await filesdb_pool.close()
     logger.success("主控退出成功。")
 
 app = FastAPI(
@@ -92,6 +114,8 @@ async def load_plugins():
 # SocketIO 部分
 sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
 socket = ASGIApp(sio)
+enabling = set()  # 正在进行上线验证的节点
+connected = set()  # 已通过认证且仍在线的连接 sid
 
 # 核心功能
 @app.middleware("http")
@@ -129,6 +153,7 @@ async def on_connect(sid, *args):
                 "token": token,
             },
         )
+        connected.add(sid)
         logger.debug(f"客户端 {sid} 连接成功: CLUSTER_ID = {cluster.id}")
         await sio.emit(
             "message",
@@ -143,6 +168,7 @@ async def on_connect(sid, *args):
 ## 当节点端退出连接时
 @sio.on("disconnect")
 async def on_disconnect(sid, *args):
+    connected.discard(sid)
     session = await sio.get_session(sid)
     cluster = Cluster(str(session["cluster_id"]))
     cluster_is_exist = await cluster.initialize()
@@ -162,35 +188,19 @@ async def on_cluster_request_cert(sid, *args):
     if cluster_is_exist == False:
         return [{"message": "错误: 节点似乎并不存在，请检查配置文件"}]
     logger.debug(f"节点 {cluster.id} 请求证书")
-    if cluster.cert_fullchain != "" and cluster.cert_privkey != "" and cluster.cert_expiry != "" and cluster.cert_expiry > datetime.now(pytz.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00'):
-        return [
-            None, {
-                "_id": cluster.id,
-                "clusterId": cluster.id,
-                "cert": cluster.cert_fullchain,
-                "key": cluster.cert_privkey,
-                "expires": cluster.cert_expiry,
-                "__v": 0
-            }
-        ]
-    else:
-        cert, key = await cf_client.get_certificate(f"{cluster.id}.{config.get('cluster-certificate.domain')}")
-        if cert == None or key == None:
-            return [{"message": "错误: 证书获取失败，请重新尝试。"}]
-        current_time = datetime.now(pytz.utc)
-        future_time = current_time + relativedelta(months=3)
-        formatted_time = future_time.astimezone(pytz.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
-        await cluster.edit(cert_fullchain=cert, cert_privkey=key, cert_expiry=formatted_time)
-        return [
-            None, {
-                "_id": cluster.id,
-                "clusterId": cluster.id,
-                "cert": cluster.cert_fullchain,
-                "key": cluster.cert_privkey,
-                "expires": cluster.cert_expiry,
-                "__v": 0
-            }
-        ]
+    cert = await cert_manager.get(cluster)
+    if cert is None:
+        return [{"message": "错误: 证书获取失败，请重新尝试。"}]
+    return [
+        None, {
+            "_id": cluster.id,
+            "clusterId": cluster.id,
+            "cert": cert.fullchain,
+            "key": cert.privkey,
+            "expires": cert.expires,
+            "__v": 0
+        }
+    ]
 
 ## 节点启动时
 @sio.on("enable")
@@ -203,21 +213,28 @@ async def on_cluster_enable(sid, data: dict, *args):
         return [{"message": "错误: 节点似乎并不存在，请检查配置文件"}]
     if oclm.include(cluster.id):
         return [{"message": "错误: 节点已经在线，请检查配置文件"}]
+    if cluster.id in enabling:
+        return [{"message": "错误: 节点正在上线中，请勿重复请求"}]
+    # 上线验证（DNS、测速）放入任务队列，限制并发且不阻塞事件循环
+    enabling.add(cluster.id)
+    try:
+        return await enable_queue.submit(enable_cluster, sid, cluster, data)
+    except Exception as e:
+        return [{"message": f"错误: {e}"}]
+    finally:
+        enabling.discard(cluster.id)
+
+
+async def enable_cluster(sid, cluster: Cluster, data: dict):
+    # 任务排队期间节点可能已经断开
+    if sid not in connected:
+        logger.debug(f"{cluster.id} 已断开连接，取消上线")
+        return [{"message": "错误: 节点已断开连接"}]
     host = data.get("host", data.get("ip"))
     byoc = data.get("byoc", False)
     if byoc == False:
-        all_records = await cf_client.get_all_records()
-        for record in all_records:
-            if cluster.id in record["name"]:
-                cf_id = record["id"]
-                break
-            else:
-                cf_id = None
-        if cf_id == None:
-            await cf_client.create_record(cluster.id, "A", data.get("host", data.get("ip")))
-        else:
-            await cf_client.update_record(id, cluster.id, "A", data.get("host", data.get("ip")))
         host = f"{cluster.id}.{config.get('cluster-certificate.domain')}"
+        await dns_reconciler.set_record(host, "A", data.get("host", data.get("ip")))
 
     await cluster.edit(
         host=host,
@@ -231,26 +248,36 @@ async def on_cluster_enable(sid, data: dict, *args):
             f"当前版本已过时，推荐升级到 v{const.latest_version} 或以上版本。",
             sid,
         )
-    time.sleep(1)
-    bandwidth = await utils.measure_cluster(10, cluster)
-    if bandwidth[0] and bandwidth[1] >= 10:
-        await cluster.edit(measureBandwidth=int(bandwidth[1]))
+    await asyncio.sleep(1)
+    try:
+        result = await measure_engine.measure(cluster, 10)
+    except Exception as e:
+        logger.debug(f"{cluster.id} 测速失败: {repr(e)}")
+        return [{"message": f"错误: {repr(e)}"}]
+    bandwidth = result["median"]
+    if bandwidth >= 10:
+        await cluster.edit(
+            measureBandwidth=int(bandwidth), measureBandwidthP10=int(result["p10"])
+        )
         if cluster.trust < 0:
             await sio.emit("message", "节点信任度过低，请保持稳定在线。", sid)
-        oclm.append(cluster.id)
-        logger.debug(f"节点 {cluster.id} 上线: 测量带宽 = {bandwidth[1]}Mbps")
+        # 测速期间节点可能已经断开，此时 on_disconnect 不会再移除它，不能加入在线列表
+        if sid not in connected:
+            logger.debug(f"{cluster.id} 在上线验证期间断开连接，取消上线")
+            return [{"message": "错误: 节点已断开连接"}]
+        oclm.append(cluster)
+        logger.debug(
+            f"节点 {cluster.id} 上线: 测量带宽 = {bandwidth:.2f}Mbps (p10 = {result['p10']:.2f}Mbps)"
+        )
         return [None, True]
-    elif bandwidth[0] and bandwidth[1] < 10:
-        logger.debug(f"{cluster.id} 测速不合格: {bandwidth[1]}Mbps")
+    else:
+        logger.debug(f"{cluster.id} 测速不合格: {bandwidth}Mbps")
         return [
             {
-                "message": f"错误: 测量带宽小于 10Mbps，（测量的带宽数值为 {bandwidth[1]}），请重试尝试上线"
+                "message": f"错误: 测量带宽小于 10Mbps，（测量的带宽数值为 {bandwidth}），请重试尝试上线"
             }
         ]
-    else:
-        logger.debug(f"{cluster.id} 测速失败: {bandwidth[1]}")
-        return [{"message": f"错误: {bandwidth[1]}"}]
-    
+
 ## 节点保活时
 @sio.on("keep-alive")
 async def on_cluster_keep_alive(sid, data, *args):
@@ -259,8 +286,9 @@ async def on_cluster_keep_alive(sid, data, *args):
     cluster_is_exist = await cluster.initialize()
     if cluster_is_exist == False or oclm.include(cluster.id) == False:
         return [None, False]
+    loads.record(cluster.id, int(data["hits"]), int(data["bytes"]))
     logger.debug(
-        f"节点 {cluster.id} 保活成功: 次数 = {data["hits"]}, 数据量 = {utils.hum_convert(data['bytes'])}"
+        f"节点 {cluster.id} 保活成功: 次数 = {data['hits']}, 数据量 = {utils.hum_convert(data['bytes'])}"
     )
     return [None, datetime.now(timezone.utc).isoformat()]
 
@@ -0,0 +1,503 @@
+# 第三方库
+import os
+import random
+import asyncio
+import datetime
+import acme.errors
+import acme.challenges
+import acme.crypto_util
+import dns.message
+import dns.resolver
+import dns.exception
+import dns.rdatatype
+import dns.asyncquery
+import dns.asyncresolver
+import multiprocessing
+from josepy.jwk import JWKRSA
+from acme import messages
+from acme import client as acme_client
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec
+
+# 本地库
+import core.const as const
+from core.config import config
+from core.logger import logger
+from core.dns.cloudflare import CloudFlareAPI, cf_client
+
+
+# 生成私钥并返回 PEM，在进程池中执行；key_type 为 rsa 或 ec（P-256）
+def generate_key(key_type: str = "rsa", key_size: int = 4096) -> bytes:
+    if key_type == "ec":
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+# 预生成的证书私钥池，取走后在进程池中补充，签发时无需等待密钥生成
+class KeyPool:
+    def __init__(self, get_executor, key_type: str = "rsa", key_size: int = 4096, size: int = 4):
+        self.get_executor = get_executor
+        self.key_type = key_type
+        self.key_size = key_size
+        self.size = size
+        self.keys = deque()
+        self.task = None
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    async def generate(self) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.get_executor(), generate_key, self.key_type, self.key_size
+        )
+
+    def refill_later(self):
+        if self.size > 0 and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.refill())
+
+    async def refill(self):
+        try:
+            while len(self.keys) < self.size:
+                self.keys.append(await self.generate())
+        except Exception as e:
+            logger.warning(f"预生成私钥失败: {repr(e)}")
+
+    async def get(self) -> bytes:
+        if self.keys:
+            self.hits += 1
+            key = self.keys.popleft()
+        else:
+            self.misses += 1
+            key = await self.generate()
+        self.refill_later()
+        return key
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def metrics(self):
+        return {
+            "keyType": self.key_type,
+            "pooled": len(self.keys),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# 异步证书签发服务：密钥生成放入进程池，阻塞的 ACME 调用放入线程池，
+# 轮询 DNS 确认 TXT 记录生效，同一域名的并发请求合并为一次签发
+class CertificateService:
+    def __init__(
+        self,
+        dns_api: CloudFlareAPI,
+        directory: str = "https://acme-v02.api.letsencrypt.org/directory",
+        email: str | None = None,
+        concurrency: int = 2,
+        propagation_timeout: float = 300,
+        nameservers: list | None = None,
+        verify_ssl: bool = True,
+        account_key_path: str = "./data/acme/account.pem",
+        key_type: str = "rsa",
+        key_size: int = 4096,
+        pool_size: int = 4,
+    ):
+        self.dns_api = dns_api
+        self.directory = directory
+        self.email = email
+        self.propagation_timeout = propagation_timeout
+        self.nameservers = nameservers
+        self.verify_ssl = verify_ssl
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.inflight = {}  # 域名 -> 正在进行的签发任务
+        self.executor = None
+        self.account_key_path = account_key_path
+        self.account_key = None
+        self.client = None  # 已注册账号的 ACME 客户端，在多次签发间复用
+        self.client_lock = asyncio.Lock()
+        self.key_pool = KeyPool(self.get_executor, key_type, key_size, pool_size)
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # 此时进程中已有事件循环与线程池，fork 可能复制其他线程持有的锁，改用 spawn
+            self.executor = ProcessPoolExecutor(
+                max_workers=2, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def start(self):
+        self.key_pool.refill_later()
+
+    async def close(self):
+        await self.key_pool.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.client is not None:
+            self.client.net.session.close()
+            self.client = None
+
+    # 读取持久化的 ACME 账号密钥，不存在时生成并保存；调用方需持有 client_lock，
+    # 避免首次启动时并发签发各自生成不同的账号密钥
+    async def load_account_key(self) -> JWKRSA:
+        if self.account_key is None:
+            if os.path.exists(self.account_key_path):
+                with open(self.account_key_path, "rb") as f:
+                    pem = f.read()
+            else:
+                loop = asyncio.get_running_loop()
+                pem = await loop.run_in_executor(
+                    self.get_executor(), generate_key, "rsa", 2048
+                )
+                os.makedirs(os.path.dirname(self.account_key_path) or ".", exist_ok=True)
+                temp_path = f"{self.account_key_path}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(pem)
+                os.chmod(temp_path, 0o600)
+                os.replace(temp_path, self.account_key_path)
+            self.account_key = JWKRSA(
+                key=serialization.load_pem_private_key(pem, password=None)
+            )
+        return self.account_key
+
+    async def get_client(self) -> acme_client.ClientV2:
+        async with self.client_lock:
+            if self.client is None:
+                self.client = await self.create_client(await self.load_account_key())
+        return self.client
+
+    # 签发证书，返回 (证书链 PEM, 私钥 PEM)，失败时返回 (None, None)
+    async def issue(self, domain: str):
+        task = self.inflight.get(domain)
+        if task is None:
+            task = asyncio.create_task(self.issue_once(domain))
+            self.inflight[domain] = task
+            task.add_done_callback(lambda _: self.inflight.pop(domain, None))
+        return await asyncio.shield(task)
+
+    async def issue_once(self, domain: str):
+        async with self.semaphore:
+            try:
+                return await self.order(domain)
+            except Exception as e:
+                logger.error(f"签发 {domain} 的证书失败: {repr(e)}")
+                self.client = None  # 下次签发时重新获取账号信息
+                return None, None
+
+    async def create_client(self, account_key: JWKRSA):
+        net = acme_client.ClientNetwork(
+            account_key, verify_ssl=self.verify_ssl, user_agent=const.user_agent
+        )  # 创建一个网络对象，用于与 ACME 服务器通信
+        directory = messages.Directory.from_json(
+            (await asyncio.to_thread(net.get, self.directory)).json()
+        )  # 获取 ACME 目录
+        client = acme_client.ClientV2(directory, net)
+        try:
+            await asyncio.to_thread(
+                client.new_account,
+                messages.NewRegistration.from_data(
+                    email=self.email, terms_of_service_agreed=True
+                ),
+            )  # 注册账号
+        except acme.errors.ConflictError as e:
+            # 账号已存在，直接使用
+            regr = messages.RegistrationResource(
+                uri=e.location, body=messages.Registration()
+            )
+            await asyncio.to_thread(client.query_registration, regr)
+        return client
+
+    async def order(self, domain: str):
+        client, private_key_pem = await asyncio.gather(
+            self.get_client(), self.key_pool.get()
+        )
+        account_key = client.net.key  # 必须与注册账号的客户端使用同一把密钥
+
+        csr_pem = acme.crypto_util.make_csr(private_key_pem, [domain])  # 创建 CSR
+        order = await asyncio.to_thread(client.new_order, csr_pem)  # 创建新订单
+
+        # 为所有授权同时创建 DNS-01 记录
+        challenges = []
+        for authorization in order.authorizations:
+            for challenge in authorization.body.challenges:
+                if isinstance(challenge.chall, acme.challenges.DNS01):
+                    name = f"_acme-challenge.{authorization.body.identifier.value}"
+                    challenges.append(
+                        (challenge, name, challenge.chall.validation(account_key))
+                    )
+                    break
+        records = await asyncio.gather(
+            *[
+                self.dns_api.create_record(name, "TXT", validation)
+                for _, name, validation in challenges
+            ]
+        )
+        try:
+            if any(record is None for record in records):
+                raise RuntimeError("创建 DNS 验证记录失败")
+            await asyncio.gather(
+                *[
+                    self.wait_for_txt(name, validation)
+                    for _, name, validation in challenges
+                ]
+            )
+            # 使用 ACME 客户端回答 DNS-01 挑战
+            for challenge, _, _ in challenges:
+                await asyncio.to_thread(
+                    client.answer_challenge,
+                    challenge,
+                    challenge.chall.response(account_key),
+                )
+            deadline = datetime.datetime.now() + datetime.timedelta(seconds=90)
+            try:
+                finalize_order = await asyncio.to_thread(
+                    client.poll_and_finalize, order, deadline
+                )
+            except acme.errors.ValidationError:
+                finalize_order = None
+        finally:
+            await asyncio.gather(
+                *[
+                    self.dns_api.delete_record(record["result"]["id"])
+                    for record in records
+                    if record is not None
+                ]
+            )
+        if finalize_order is None:
+            return None, None
+        return finalize_order.fullchain_pem, private_key_pem.decode()
+
+    # 查找记录所在区域的权威服务器地址；ACME CA 直接查询权威服务器，
+    # 而递归解析器会缓存 NXDOMAIN，在负缓存 TTL 内一直查不到新记录
+    async def find_authoritative(self, name: str) -> list:
+        resolver = dns.asyncresolver.Resolver()
+        zone = await dns.asyncresolver.zone_for_name(name, resolver=resolver)
+        addresses = []
+        for ns in await resolver.resolve(zone, "NS"):
+            try:
+                answer = await resolver.resolve(ns.target, "A")
+                addresses.extend(rdata.address for rdata in answer)
+            except dns.exception.DNSException:
+                continue
+        if not addresses:
+            raise dns.resolver.NoNameservers(f"无法解析 {zone} 的权威服务器")
+        return addresses
+
+    async def query_txt(self, address: str, name: str) -> set:
+        query = dns.message.make_query(name, "TXT")
+        response, _ = await dns.asyncquery.udp_with_fallback(query, address, timeout=5)
+        values = set()
+        for rrset in response.answer:
+            if rrset.rdtype == dns.rdatatype.TXT:
+                values.update(b"".join(rdata.strings).decode() for rdata in rrset)
+        return values
+
+    # 轮询 DNS 直到 TXT 记录生效，代替固定时长的等待；配置了 nameservers 时查询
+    # 指定的服务器，否则要求区域的所有权威服务器都已返回该记录
+    async def wait_for_txt(self, name: str, value: str):
+        resolver, addresses = None, []
+        if self.nameservers:
+            resolver = dns.asyncresolver.Resolver()
+            resolver.nameservers = self.nameservers
+        else:
+            try:
+                addresses = await self.find_authoritative(name)
+            except dns.exception.DNSException as e:
+                logger.warning(f"查找 {name} 的权威服务器失败，改用系统解析器: {repr(e)}")
+                resolver = dns.asyncresolver.Resolver()
+        deadline = asyncio.get_running_loop().time() + self.propagation_timeout
+        delay = 2
+        while True:
+            try:
+                if resolver is not None:
+                    answer = await resolver.resolve(name, "TXT")
+                    if value in {b"".join(rdata.strings).decode() for rdata in answer}:
+                        return
+                else:
+                    results = await asyncio.gather(
+                        *[self.query_txt(address, name) for address in addresses]
+                    )
+                    if all(value in values for values in results):
+                        return
+            except (
+                dns.resolver.NXDOMAIN,
+                dns.resolver.NoAnswer,
+                dns.exception.Timeout,
+                OSError,
+            ):
+                pass
+            if asyncio.get_running_loop().time() + delay > deadline:
+                raise TimeoutError(f"等待 {name} 的 TXT 记录生效超时")
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, 15)
+
+cert_service = CertificateService(
+    cf_client,
+    config.get(
+        "cluster-certificate.directory",
+        "https://acme-v02.api.letsencrypt.org/directory",
+    ),
+    config.get("cluster-certificate.email"),
+    int(config.get("cluster-certificate.concurrency", 2)),
+    float(config.get("cluster-certificate.propagation_timeout", 300)),
+    config.get("cluster-certificate.nameservers"),
+    bool(config.get("cluster-certificate.verify_ssl", True)),
+    config.get("cluster-certificate.account_key", "./data/acme/account.pem"),
+    config.get("cluster-certificate.key_type", "rsa"),
+    int(config.get("cluster-certificate.key_size", 4096)),
+    int(config.get("cluster-certificate.key_pool_size", 4)),
+)
+
+
+# 内存中的证书，附带解析后的过期时间
+class Certificate:
+    def __init__(self, fullchain: str, privkey: str):
+        self.fullchain = fullchain
+        self.privkey = privkey
+        self.expiry = x509.load_pem_x509_certificate(
+            fullchain.encode()
+        ).not_valid_after_utc
+
+    @property
+    def expires(self) -> str:
+        return self.expiry.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+    def remaining(self) -> datetime.timedelta:
+        return self.expiry - datetime.datetime.now(datetime.timezone.utc)
+
+
+# 证书管理：默认为每个节点签发独立证书；开启 wildcard 后所有节点共用同一张通配符证书
+# （任何节点都能持有该私钥冒充其他节点，仅适用于节点均可信的部署），
+# 证书缓存在内存中，后台任务在过期前主动续期，节点请求证书时只需查表
+class CertificateManager:
+    def __init__(
+        self,
+        service: CertificateService,
+        domain: str,
+        wildcard: bool = False,
+        renew_before: float = 30,
+        check_interval: float = 3600,
+        cache_dir: str = "./data/certificates",
+    ):
+        self.service = service
+        self.domain = domain
+        self.wildcard = wildcard
+        self.renew_before = datetime.timedelta(days=renew_before)
+        self.check_interval = check_interval
+        self.cache_dir = cache_dir
+        self.certs = {}  # 域名 -> Certificate
+        self.locks = {}  # 域名 -> asyncio.Lock，避免同一证书被重复续期
+        self.task = None
+
+    def name_of(self, cluster_id: str) -> str:
+        return f"*.{self.domain}" if self.wildcard else f"{cluster_id}.{self.domain}"
+
+    def cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name.replace("*", "_wildcard"))
+
+    def needs_renewal(self, cert: Certificate | None) -> bool:
+        return cert is None or cert.remaining() < self.renew_before
+
+    # 从磁盘加载通配符证书，避免重启后重复签发
+    def load(self):
+        if not self.wildcard:
+            return
+        name = self.name_of("")
+        path = self.cache_path(name)
+        if os.path.exists(f"{path}.crt") and os.path.exists(f"{path}.key"):
+            with open(f"{path}.crt", "r") as f:
+                fullchain = f.read()
+            with open(f"{path}.key", "r") as f:
+                privkey = f.read()
+            self.certs[name] = Certificate(fullchain, privkey)
+            logger.debug(f"已加载证书 {name}，过期时间 {self.certs[name].expires}")
+
+    def dump(self, name: str, cert: Certificate):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.cache_path(name)
+        with open(f"{path}.crt", "w") as f:
+            f.write(cert.fullchain)
+        with open(f"{path}.key", "w") as f:
+            f.write(cert.privkey)
+
+    async def renew(self, name: str) -> Certificate | None:
+        async with self.locks.setdefault(name, asyncio.Lock()):
+            cert = self.certs.get(name)
+            if not self.needs_renewal(cert):
+                return cert  # 等待期间已由其他请求完成续期
+            fullchain, privkey = await self.service.issue(name)
+            if fullchain is None or privkey is None:
+                return None
+            cert = Certificate(fullchain, privkey)
+            self.certs[name] = cert
+            if self.wildcard:
+                await asyncio.to_thread(self.dump, name, cert)
+            logger.info(f"证书 {name} 签发成功，过期时间 {cert.expires}")
+            return cert
+
+    # 获取节点可用的证书，需要时签发；单节点证书会写回节点信息
+    async def get(self, cluster) -> Certificate | None:
+        name = self.name_of(cluster.id)
+        cert = self.certs.get(name)
+        if cert is None and not self.wildcard and cluster.cert_fullchain and cluster.cert_privkey:
+            try:
+                cert = self.certs[name] = Certificate(
+                    cluster.cert_fullchain, cluster.cert_privkey
+                )
+            except ValueError:
+                cert = None
+        if self.needs_renewal(cert):
+            cert = await self.renew(name) or cert
+            if cert is None or cert.remaining() <= datetime.timedelta(0):
+                return None
+        if not self.wildcard and cert.fullchain != cluster.cert_fullchain:
+            await cluster.edit(
+                cert_fullchain=cert.fullchain,
+                cert_privkey=cert.privkey,
+                cert_expiry=cert.expires,
+            )
+        return cert
+
+    def start(self):
+        self.load()
+        if not self.wildcard:
+            self.service.start()  # 单节点证书模式下签发频繁，提前填充私钥池
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            if self.wildcard and self.needs_renewal(self.certs.get(self.name_of(""))):
+                await self.renew(self.name_of(""))
+            for name, cert in list(self.certs.items()):
+                if not (self.wildcard and name == self.name_of("")) and self.needs_renewal(cert):
+                    await self.renew(name)
+            await asyncio.sleep(self.check_interval * random.uniform(0.9, 1.1))
+
+
+cert_manager = CertificateManager(
+    cert_service,
+    config.get("cluster-certificate.domain"),
+    bool(config.get("cluster-certificate.wildcard", False)),
+    float(config.get("cluster-certificate.renew_before_days", 30)),
+    float(config.get("cluster-certificate.check_interval", 3600)),
+    config.get("cluster-certificate.cache_dir", "./data/certificates"),
+)
@@ -1,24 +1,7 @@
 # 第三方库
-import re
-import time
-import acme
-import acme.errors
 import httpx
-import josepy
 import asyncio
-import datetime
-import cryptography
-import acme.challenges
-import acme.crypto_util
-import cryptography.utils
-import cryptography.x509
-from josepy.jwk import JWKRSA
-from acme import client, messages
-from acme import client as acme_client
-from cryptography.x509.oid import NameOID
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
+import importlib.util
 
 # 本地库
 import core.const as const
@@ -26,15 +9,25 @@ from core.config import config
 
 
 class CloudFlareAPI:
-    def __init__(self, email: str, api_token: str, zone_id: str):
+    def __init__(
+        self,
+        email: str,
+        api_token: str,
+        zone_id: str,
+        api_url: str = "https://api.cloudflare.com/client/v4",
+    ):
         self.email = email
         self.api_token = api_token
         self.zone_id = zone_id
+        self.api_url = api_url
         self.headers = {
             "Content-Type": "application/json",
             "User-Agent": const.user_agent,
             "Authorization": f"Bearer {self.api_token}",
         }
+        self.client = None
+        self.records = {}  # 记录名 -> DNS 记录，本地缓存
+        self.records_loaded = False
 
     async def __aenter__(self):
         return self
@@ -42,45 +35,74 @@ class CloudFlareAPI:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass
 
-    async def get_all_records(self):
-        async with httpx.AsyncClient() as client:
-            data = await client.get(
-                f"https://api.cloudflare.com/client/v4/zones/{self.zone_id}/dns_records",
+    # 长连接的 HTTP 客户端，安装了 h2 时启用 HTTP/2
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=f"{self.api_url}/zones/{self.zone_id}",
                 headers=self.headers,
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=httpx.Timeout(30, connect=10),
             )
-        if data.status_code == 200:
-            result = list(data.json()["result"])
-            return result
-        else:
-            return None
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    # 读取区域内全部记录；失败时抛出异常，不能当作“记录不存在”处理，
+    # 否则会为已有 A 记录的名称重复创建记录
+    async def get_all_records(self):
+        result = []
+        page = 1
+        while True:
+            data = await self.get_client().get(
+                "/dns_records", params={"page": page, "per_page": 1000}
+            )
+            if data.status_code != 200:
+                raise RuntimeError(f"获取 DNS 记录列表失败: HTTP {data.status_code}")
+            body = data.json()
+            result.extend(body["result"])
+            info = body.get("result_info") or {}
+            if page >= info.get("total_pages", 1):
+                break
+            page += 1
+        self.records = {record["name"]: record for record in result}
+        self.records_loaded = True
+        return result
+
+    async def find_record(self, name: str):
+        if not self.records_loaded:
+            await self.get_all_records()
+        return self.records.get(name)
 
     async def create_record(
         self, name: str, type: str, content: str, ttl: int = 60, proxied=False
     ):
-        async with httpx.AsyncClient() as client:
-            data = await client.post(
-                f"https://api.cloudflare.com/client/v4/zones/{self.zone_id}/dns_records",
-                headers=self.headers,
-                json={
-                    "type": type,
-                    "name": name,
-                    "content": content,
-                    "ttl": ttl,
-                    "proxied": proxied,
-                },
-            )
+        data = await self.get_client().post(
+            "/dns_records",
+            json={
+                "type": type,
+                "name": name,
+                "content": content,
+                "ttl": ttl,
+                "proxied": proxied,
+            },
+        )
         if data.status_code == 200:
-            return data.json()
+            result = data.json()
+            self.records[result["result"]["name"]] = result["result"]
+            return result
         else:
             return None
 
     async def delete_record(self, record_id: str):
-        async with httpx.AsyncClient() as client:
-            data = await client.delete(
-                f"https://api.cloudflare.com/client/v4/zones/{self.zone_id}/dns_records/{record_id}",
-                headers=self.headers,
-            )
+        data = await self.get_client().delete(f"/dns_records/{record_id}")
         if data.status_code == 200:
+            for name, record in list(self.records.items()):
+                if record["id"] == record_id:
+                    del self.records[name]
             return data.json()
         else:
             return None
@@ -94,91 +116,123 @@ class CloudFlareAPI:
         ttl: int = 60,
         proxied=False,
     ):
-        async with httpx.AsyncClient() as client:
-            data = await client.patch(
-                f"https://api.cloudflare.com/client/v4/zones/{self.zone_id}/dns_records/{record_id}"
-            )
+        data = await self.get_client().patch(
+            f"/dns_records/{record_id}",
+            json={
+                "type": type,
+                "name": name,
+                "content": content,
+                "ttl": ttl,
+                "proxied": proxied,
+            },
+        )
         if data.status_code == 200:
-            return data.json()
+            result = data.json()
+            self.records[result["result"]["name"]] = result["result"]
+            return result
         else:
             return None
 
-    async def get_certificate(self, domain: str):
-        key = rsa.generate_private_key(
-            public_exponent=65537, key_size=4096
-        )  # 生成一个 RSA 密钥对
-
-        ssl_key = rsa.generate_private_key(
-            public_exponent=65537, key_size=4096
-        )  # 生成一个 RSA 密钥对
-
-        private_key_pem = ssl_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm=serialization.NoEncryption(),
-        )  # 将私钥转换为 PEM 格式
-
-        account_key = JWKRSA(key=key)  # 创建一个 ACME 账户密钥对
-
-        net = acme_client.ClientNetwork(
-            account_key
-        )  # 创建一个网络对象，用于与 ACME 服务器通信
-
-        # 获取 ACME 目录
-        directory = messages.Directory.from_json(
-            net.get("https://acme-v02.api.letsencrypt.org/directory").json()
+    # 使用批量接口一次提交多条新增与修改，返回是否成功
+    async def batch_records(self, posts: list, patches: list):
+        data = await self.get_client().post(
+            "/dns_records/batch", json={"posts": posts, "patches": patches}
         )
-
-        client = acme_client.ClientV2(directory, net)  # 创建一个 ACME 客户端
-
-        # 注册账号
-        registration = client.new_account(
-            messages.NewRegistration.from_data(
-                email=config.get("cluster-certificate.email"),
-                terms_of_service_agreed=True,
-            )
-        )
-
-        csr_pem = acme.crypto_util.make_csr(private_key_pem, [domain])  # 创建 CSR
-
-        order = client.new_order(csr_pem)  # 创建新订单
-        order_authorizations = order.authorizations  # 获取订单的授权列表
-        for authorizations in order_authorizations:
-            challenges_list = authorizations.body.challenges
-            for challenge in challenges_list:
-                if isinstance(challenge.chall, acme.challenges.DNS01):
-                    dns_challenge = challenge
-                    dns_challenge_chall = challenge.chall
-                    break
-
-            validation = dns_challenge_chall.validation(account_key)
-            create_result = await self.create_record(
-                f"_acme-challenge.{domain}", "TXT", validation
-            )
-            id = create_result["result"]["id"]
-
-            # 等待一段时间让DNS记录传播
-            time.sleep(30)  # 可能需要更长的时间，取决于 DNS 提供商
-
-            # 使用ACME客户端回答DNS-01挑战
-            response = dns_challenge_chall.response(account_key)
-            client.answer_challenge(dns_challenge, response)
-            deadline = datetime.datetime.now() + datetime.timedelta(seconds=60)
-            try:
-                finalize_order = client.poll_and_finalize(order, deadline)
-
-            except acme.errors.ValidationError:
-                finalize_order = None
-            await self.delete_record(record_id=id)
-            break
-        if finalize_order is None:
-            return None, None
+        if data.status_code != 200:
+            return False
+        result = data.json()["result"]
+        for record in (result.get("posts") or []) + (result.get("patches") or []):
+            self.records[record["name"]] = record
+        return True
+
+
+# 将短时间内多个节点的 DNS 变更合并为少量 API 请求
+class DNSReconciler:
+    def __init__(self, api: CloudFlareAPI, delay: float = 0.5, ttl: int = 60):
+        self.api = api
+        self.delay = delay
+        self.ttl = ttl
+        self.pending = {}  # 记录名 -> (类型, 内容, [Future])
+        self.flush_task = None
+
+    # 确保记录指向 content，等待合并后的请求完成后返回
+    async def set_record(self, name: str, type: str, content: str):
+        future = asyncio.get_running_loop().create_future()
+        if name in self.pending:
+            self.pending[name][2].append(future)
+            self.pending[name] = (type, content, self.pending[name][2])
         else:
-            return finalize_order.fullchain_pem, private_key_pem.decode()
-
+            self.pending[name] = (type, content, [future])
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+        return await future
+
+    async def flush_later(self):
+        await asyncio.sleep(self.delay)
+        pending, self.pending = self.pending, {}
+        self.flush_task = None
+        try:
+            failures = await self.flush(pending)
+        except Exception as e:
+            failures = {name: e for name in pending}
+        for name, (_, _, futures) in pending.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if name in failures:
+                    future.set_exception(failures[name])
+                else:
+                    future.set_result(True)
+
+    # 提交合并后的变更，返回 记录名 -> 异常，只包含写入失败的记录；
+    # 读取现有记录失败时直接抛出，此时没有写入任何记录
+    async def flush(self, pending: dict) -> dict:
+        posts, patches = [], []
+        for name, (type, content, _) in pending.items():
+            record = await self.api.find_record(name)
+            if record is None:
+                posts.append(
+                    {
+                        "type": type,
+                        "name": name,
+                        "content": content,
+                        "ttl": self.ttl,
+                        "proxied": False,
+                    }
+                )
+            elif record["type"] != type or record["content"] != content:
+                patches.append(
+                    {"id": record["id"], "name": name, "type": type, "content": content}
+                )
+        if not posts and not patches:
+            return {}
+        if await self.api.batch_records(posts, patches):
+            return {}
+        # 批量接口不可用时逐条提交，每条记录单独判断成败；失败的记录让对应的
+        # set_record 报错，避免节点在没有 DNS 记录的情况下上线，其他记录不受影响
+        failures = {}
+        for post in posts:
+            try:
+                if await self.api.create_record(
+                    post["name"], post["type"], post["content"], self.ttl
+                ) is None:
+                    raise RuntimeError(f"创建 DNS 记录 {post['name']} 失败")
+            except Exception as e:
+                failures[post["name"]] = e
+        for patch in patches:
+            try:
+                if await self.api.update_record(
+                    patch["id"], patch["name"], patch["type"], patch["content"], self.ttl
+                ) is None:
+                    raise RuntimeError(f"更新 DNS 记录 {patch['name']} 失败")
+            except Exception as e:
+                failures[patch["name"]] = e
+        return failures
 
 cf_client = CloudFlareAPI(
     config.get("cloudflare.email"),
     config.get("cloudflare.api-token"),
     config.get("cloudflare.zone-id"),
-)
\ No newline at end of file
+    config.get("cloudflare.api-url", "https://api.cloudflare.com/client/v4"),
+)
+dns_reconciler = DNSReconciler(cf_client, float(config.get("cloudflare.batch_delay", 0.5)))
\ No newline at end of file
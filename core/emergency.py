@@ -0,0 +1,237 @@
+# 第三方库
+import os
+import time
+import asyncio
+from fastapi import Request, Response, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+# 本地库
+import core.utils as utils
+from core.config import config
+from core.logger import logger
+from core.types import Cluster
+from core.upstream import upstream_cache
+
+
+# 全局令牌桶，限制应急同步占用的总带宽；rate 为 0 时不限速
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate  # 字节/秒
+        self.burst = burst  # 桶容量（字节）
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    # 先扣除令牌，不足时按欠额等待，并发请求按到达顺序平分带宽
+    async def consume(self, amount: int):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+# 限制每个节点同时进行的应急下载数量
+class NodeLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = {}  # 节点 ID -> 正在进行的下载数量
+        self.rejected = 0
+
+    def acquire(self, cluster_id: str) -> bool:
+        count = self.active.get(cluster_id, 0)
+        if count >= self.limit:
+            self.rejected += 1
+            return False
+        self.active[cluster_id] = count + 1
+        return True
+
+    def release(self, cluster_id: str):
+        count = self.active.get(cluster_id, 0) - 1
+        if count > 0:
+            self.active[cluster_id] = count
+        else:
+            self.active.pop(cluster_id, None)
+
+    # 占用一个名额，返回只会生效一次的释放函数；超出上限时返回 None
+    def lease(self, cluster_id: str):
+        if not self.acquire(cluster_id):
+            return None
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release(cluster_id)
+
+        return release
+
+
+# 应急同步：从主控本地镜像向节点提供文件，支持 Range 与 ETag
+class EmergencyServer:
+    def __init__(
+        self,
+        root: str,
+        per_node: int = 4,
+        bandwidth: float = 0,
+        chunk_size: int = 256 * 1024,
+    ):
+        self.root = os.path.realpath(root)
+        self.limiter = NodeLimiter(per_node)
+        rate = bandwidth * 1024 * 1024 / 8  # Mbps -> 字节/秒
+        self.bucket = TokenBucket(rate, max(rate, chunk_size))
+        self.chunk_size = chunk_size
+        # 统计信息
+        self.served = 0
+        self.bytes = 0
+
+    # 校验 Authorization: Bearer <token>，与 Socket.IO 连接时相同：
+    # 节点必须存在且令牌中的 secret 一致，challenge 令牌不能用于下载
+    async def authorize(self, request: Request) -> str:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(401, detail="缺少令牌")
+        try:
+            payload = utils.decode_jwt(token)
+        except Exception:
+            raise HTTPException(401, detail="令牌无效")
+        if payload.get("typ") == "challenge" or "cluster_secret" not in payload:
+            raise HTTPException(401, detail="令牌无效")
+        cluster = Cluster(str(payload.get("cluster_id", "")))
+        if not await cluster.initialize() or cluster.secret != payload["cluster_secret"]:
+            raise HTTPException(401, detail="令牌无效")
+        return cluster.id
+
+    # 将 FILELIST 中的相对路径解析为本地文件，禁止越出镜像目录
+    def resolve(self, path: str) -> str | None:
+        full_path = os.path.realpath(os.path.join(self.root, path.lstrip("/")))
+        if not full_path.startswith(self.root + os.sep) or not os.path.isfile(full_path):
+            return None
+        return full_path
+
+    # 解析单个 Range，返回 (start, end)（含 end）；无法满足时抛出 416，不支持的格式返回 None
+    def parse_range(self, header: str, size: int):
+        unit, _, spec = header.partition("=")
+        if unit.strip().lower() != "bytes" or "," in spec:
+            return None  # 多段 Range 按完整文件返回
+        first, _, last = spec.strip().partition("-")
+        try:
+            if first == "":
+                length = int(last)
+                if length <= 0:
+                    raise ValueError
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+        except ValueError:
+            return None
+        if start >= size or start > end:
+            raise HTTPException(
+                416, detail="请求范围无效", headers={"Content-Range": f"bytes */{size}"}
+            )
+        return start, end
+
+    async def read_range(self, path: str, start: int, end: int):
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"文件 {path} 在发送过程中被截断")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    # 限速发送并在结束时释放名额；出错时 Starlette 不会执行 background，因此在这里释放
+    async def throttle(self, stream, release):
+        try:
+            async for chunk in stream:
+                await self.bucket.consume(len(chunk))
+                self.bytes += len(chunk)
+                yield chunk
+        finally:
+            release()
+            await stream.aclose()
+
+    def stream_response(self, stream, release, **kwargs) -> StreamingResponse:
+        return StreamingResponse(
+            self.throttle(stream, release),
+            media_type="application/octet-stream",
+            # 生成器未开始迭代时客户端就断开，finally 不会执行，由 background 兜底
+            background=BackgroundTask(release),
+            **kwargs,
+        )
+
+    async def serve(self, request: Request, cluster_id: str, path: str, hash: str) -> Response:
+        etag = f'"{hash}"'
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "public, max-age=31536000, immutable",  # 内容由哈希确定
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        size = os.path.getsize(path)
+        start, end, status = 0, size - 1, 200
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and size > 0 and (if_range is None or if_range == etag):
+            parsed = self.parse_range(range_header, size)
+            if parsed is not None:
+                start, end = parsed
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        release = self.limiter.lease(cluster_id)
+        if release is None:
+            raise HTTPException(429, detail="应急同步并发数过多", headers={"Retry-After": "5"})
+        self.served += 1
+        logger.debug(f"节点 {cluster_id} 应急同步 {hash} ({start}-{end}/{size})")
+        return self.stream_response(
+            self.read_range(path, start, end), release, status_code=status, headers=headers
+        )
+
+    # 边从上游拉取边发送，此时不支持 Range，始终返回完整文件
+    async def serve_stream(
+        self, request: Request, cluster_id: str, stream, hash: str, size: int
+    ) -> Response:
+        headers = {"ETag": f'"{hash}"'}
+        if size:
+            headers["Content-Length"] = str(size)
+        release = self.limiter.lease(cluster_id)
+        if release is None:
+            await stream.aclose()
+            raise HTTPException(429, detail="应急同步并发数过多", headers={"Retry-After": "5"})
+        try:
+            stream = await upstream_cache.prime(stream)
+        except BaseException:
+            release()
+            raise
+        self.served += 1
+        logger.debug(f"节点 {cluster_id} 应急同步 {hash}（从上游拉取）")
+        return self.stream_response(stream, release, headers=headers)
+
+    def metrics(self):
+        return {
+            "active": sum(self.limiter.active.values()),
+            "nodes": len(self.limiter.active),
+            "served": self.served,
+            "rejected": self.limiter.rejected,
+            "bytes": self.bytes,
+        }
+
+
+emergency_server = EmergencyServer(
+    config.get("download_path", "./files"),
+    int(config.get("emergency.per_node", 4)),
+    float(config.get("emergency.bandwidth", 0)),
+    int(config.get("emergency.chunk_size", 256 * 1024)),
+)
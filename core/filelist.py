@@ -0,0 +1,157 @@
+# 第三方库
+import os
+import json
+import pyzstd
+import asyncio
+import hashlib
+from contextlib import aclosing
+
+# 本地库
+from core.types import AvroEncoder
+from core.logger import logger
+from core.config import config
+from core.filesdb import FilesDB
+
+
+# 将一块文件记录编码后送入增量压缩器，返回已产生的压缩数据
+def compress_chunk(
+    encoder: AvroEncoder, compressor: pyzstd.ZstdCompressor, files: list
+) -> bytes:
+    encoder.writeFiles(files)
+    return compressor.compress(encoder.flush())
+
+
+# 生成 OpenBMCLAPI 格式的文件列表，按块读取并增量压缩，内存中只保留压缩后的数据；
+# 读连接与读事务只在读取和压缩期间占用，全部压缩完成后才开始向客户端发送，
+# 避免慢速客户端长时间占用连接池并阻止 WAL 检查点
+class FileListStream:
+    def __init__(self, mtime: int | None = None, chunk_size: int = 10000):
+        self.mtime = mtime
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.lastModified = 0
+
+    async def compress(self) -> list:
+        encoder = AvroEncoder()
+        compressor = pyzstd.ZstdCompressor()
+        parts = []
+        async with FilesDB() as filesdb:
+            async with aclosing(
+                filesdb.iter_files(self.mtime, self.chunk_size)
+            ) as files:
+                self.count, self.lastModified = await anext(files)
+                encoder.writeVarInt(self.count)  # 写入文件数量
+                async for rows in files:
+                    data = await asyncio.to_thread(
+                        compress_chunk, encoder, compressor, rows
+                    )
+                    if data:
+                        parts.append(data)
+        encoder.write(b"\x00")
+        parts.append(compressor.compress(encoder.flush()) + compressor.flush())
+        return parts
+
+    async def __aiter__(self):
+        for part in await self.compress():
+            yield part
+
+
+# 文件列表快照，仅在 FILELIST 发生变化后重新生成
+class FileListSnapshot:
+    def __init__(self, cache_path: str | None = None):
+        self.cache_path = cache_path
+        self.version = -1
+        self.content = None
+        self.etag = None
+        self.lastModified = None  # 快照中最大的 MTIME，未知时为 None
+        self.data_version = None  # 生成快照时数据库中的 FILELIST 数据版本
+        self.lock = asyncio.Lock()
+
+    def is_stale(self):
+        return self.content is None or self.version != FilesDB.version
+
+    async def get(self):
+        if self.is_stale():
+            async with self.lock:
+                if self.is_stale():
+                    await self.build()
+        return self
+
+    async def build(self):
+        version = FilesDB.version
+        # 在生成前读取：生成期间若有写入，磁盘上的版本会更新，下次加载时快照被视为过期
+        async with FilesDB() as filesdb:
+            self.data_version = await filesdb.data_version()
+        stream = FileListStream()
+        content = b"".join(await stream.compress())
+        self.update(content, version)
+        self.lastModified = stream.lastModified
+        logger.debug(f"文件列表快照已重新生成: 版本 = {version}, 文件数量 = {stream.count}")
+        if self.cache_path:
+            await asyncio.to_thread(self.dump)
+
+    def update(self, content: bytes, version: int):
+        self.content = content
+        self.version = version
+        self.etag = f'"{hashlib.sha1(content).hexdigest()}"'
+
+    # 将快照与其对应的数据版本写入磁盘，重启后可直接复用
+    def dump(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self.content)
+        os.replace(temp_path, self.cache_path)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": self.data_version, "lastModified": self.lastModified}, f
+            )
+        os.replace(temp_path, f"{self.cache_path}.meta")
+
+    def read(self):
+        with open(f"{self.cache_path}.meta", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(self.cache_path, "rb") as f:
+            content = f.read()
+        return meta, content
+
+    # 从磁盘加载快照，数据库中的 FILELIST 数据版本与快照记录的不一致时丢弃
+    async def load(self):
+        if not self.cache_path or not os.path.exists(f"{self.cache_path}.meta"):
+            return False
+        try:
+            meta, content = await asyncio.to_thread(self.read)
+        except (OSError, ValueError):
+            return False
+        async with FilesDB() as filesdb:
+            data_version = await filesdb.data_version()
+        if meta.get("version") != data_version:
+            return False
+        self.update(content, FilesDB.version)
+        self.data_version = data_version
+        self.lastModified = meta.get("lastModified")
+        logger.debug(f"已从 {self.cache_path} 加载文件列表快照")
+        return True
+
+    # 获取 lastModified 之后变更的文件列表：没有变更时返回 None；变更覆盖整个 FILELIST 时
+    # （例如首次同步时 lastModified 为 0）返回快照本身，避免每次请求都重新编码全表
+    async def delta(self, lastModified: int):
+        snapshot = None
+        if filelist_snapshot:
+            snapshot = await self.get()
+            if (
+                snapshot.lastModified is not None
+                and lastModified >= snapshot.lastModified
+            ):
+                return None
+        async with FilesDB() as filesdb:
+            if await filesdb.count(lastModified) == 0:
+                return None
+            if snapshot is not None and (
+                lastModified <= 0 or lastModified < await filesdb.min_mtime()
+            ):
+                return snapshot
+        return FileListStream(lastModified)
+
+filelist = FileListSnapshot(config.get("filelist.cache_path"))
+filelist_snapshot = bool(config.get("filelist.snapshot", True))
@@ -1,13 +1,251 @@
 import os
-import atexit
+import json
+import time
 import asyncio
 import aiosqlite
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from core.config import config
+from core.logger import logger
+
+
+# 数据库结构迁移，按顺序执行，已执行的版本记录在 PRAGMA user_version 中
+MIGRATIONS = [
+    [
+        """
+        CREATE TABLE IF NOT EXISTS FILELIST
+        (
+            HASH TEXT PRIMARY KEY,
+            PATH TEXT,
+            URL TEXT,
+            SIZE INTEGER,
+            MTIME INTEGER,
+            SOURCE TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS IDX_FILELIST_MTIME ON FILELIST (MTIME)",
+        "CREATE INDEX IF NOT EXISTS IDX_FILELIST_PATH ON FILELIST (PATH)",
+        "CREATE INDEX IF NOT EXISTS IDX_FILELIST_SOURCE ON FILELIST (SOURCE)",
+    ],
+    [
+        # 文件内容哈希缓存，元数据未变化的文件无需重新计算哈希
+        """
+        CREATE TABLE IF NOT EXISTS HASHCACHE
+        (
+            PATH TEXT PRIMARY KEY,
+            SIZE INTEGER,
+            MTIME INTEGER,
+            INODE INTEGER,
+            HASH TEXT
+        ) WITHOUT ROWID
+        """,
+    ],
+    [
+        # 同一次读取中计算出的全部摘要，JSON 格式 {算法: 摘要}
+        "ALTER TABLE HASHCACHE ADD COLUMN DIGESTS TEXT NOT NULL DEFAULT '{}'",
+    ],
+    [
+        # FILELIST 数据版本，每次写入 FILELIST 时在同一事务内加一，用于判断磁盘上的文件列表快照是否过期
+        "CREATE TABLE IF NOT EXISTS META (KEY TEXT PRIMARY KEY, VALUE INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO META VALUES ('filelist_version', 0)",
+    ],
+    [
+        # 按 HASH 查找内容相同的其他文件
+        "CREATE INDEX IF NOT EXISTS IDX_HASHCACHE_HASH ON HASHCACHE (HASH)",
+    ],
+]
+
+# 固定的查询语句，sqlite3 会按语句文本缓存预编译结果
+FIND_BY_HASH = "SELECT * FROM FILELIST WHERE HASH = ?"
+FIND_BY_PATH = "SELECT * FROM FILELIST WHERE PATH = ?"
+COLUMNS = ("HASH", "PATH", "URL", "SIZE", "MTIME", "SOURCE")
+BUMP_VERSION = "UPDATE META SET VALUE = VALUE + 1 WHERE KEY = 'filelist_version'"
+DATA_VERSION = "SELECT VALUE FROM META WHERE KEY = 'filelist_version'"
+
+
+async def migrate(conn: aiosqlite.Connection):
+    async with conn.execute("PRAGMA user_version") as cursor:
+        version = (await cursor.fetchone())[0]
+    for index, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for statement in statements:
+            await conn.execute(statement)
+        await conn.execute(f"PRAGMA user_version = {index}")
+        await conn.commit()
+        logger.info(f"数据库已迁移到版本 {index}")
+
+
+# 进程级 SQLite 连接池：固定数量的只读连接 + 一个写连接，启用 WAL 模式
+class FilesDBPool:
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.size = readers
+        self.readers = asyncio.Queue()
+        self.connections = []
+        self.writer_conn = None
+        self.write_lock = asyncio.Lock()
+        self.open_lock = asyncio.Lock()
+        self.opened = False
+        # 统计信息
+        self.in_use = 0
+        self.acquired = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    async def open(self):
+        async with self.open_lock:
+            if self.opened:
+                return
+            if not os.path.exists(self.path):
+                raise FileNotFoundError("数据库文件不存在")
+            self.writer_conn = await aiosqlite.connect(self.path)
+            await self.writer_conn.execute("PRAGMA journal_mode=WAL")
+            await self.writer_conn.execute("PRAGMA synchronous=NORMAL")
+            await migrate(self.writer_conn)
+            self.connections.append(self.writer_conn)
+            for _ in range(self.size):
+                conn = await aiosqlite.connect(self.path)
+                self.connections.append(conn)
+                self.readers.put_nowait(conn)
+            self.opened = True
+
+    async def close(self):
+        async with self.open_lock:
+            for conn in self.connections:
+                await conn.close()
+            self.connections = []
+            self.readers = asyncio.Queue()
+            self.writer_conn = None
+            self.opened = False
+
+    def record_wait(self, start: float):
+        elapsed = time.perf_counter() - start
+        self.acquired += 1
+        self.wait_time += elapsed
+        self.max_wait_time = max(self.max_wait_time, elapsed)
+
+    @asynccontextmanager
+    async def reader(self):
+        if not self.opened:
+            await self.open()
+        start = time.perf_counter()
+        conn = await self.readers.get()
+        self.record_wait(start)
+        self.in_use += 1
+        try:
+            yield conn
+        finally:
+            self.in_use -= 1
+            self.readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        if not self.opened:
+            await self.open()
+        start = time.perf_counter()
+        async with self.write_lock:
+            self.record_wait(start)
+            self.in_use += 1
+            try:
+                yield self.writer_conn
+            finally:
+                self.in_use -= 1
+
+    def metrics(self):
+        return {
+            "readers": self.size,
+            "idle": self.readers.qsize(),
+            "inUse": self.in_use,
+            "acquired": self.acquired,
+            "waitTime": self.wait_time,
+            "avgWaitTime": self.wait_time / self.acquired if self.acquired else 0,
+            "maxWaitTime": self.max_wait_time,
+        }
+
+
+# 有界 LRU 缓存，缓存 PATH 到文件元数据的映射，未找到的结果以较短的 TTL 缓存
+class FileMetaCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300, negative_ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.data = OrderedDict()  # path -> (过期时间, 元数据或 False)
+        self.hashes = {}  # hash -> path，用于按 HASH 失效
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def get(self, path: str):
+        item = self.data.get(path)
+        if item is None:
+            self.misses += 1
+            return None
+        expire, value = item
+        if expire < time.monotonic():
+            self.pop(path)
+            self.misses += 1
+            return None
+        self.data.move_to_end(path)
+        self.hits += 1
+        if value is False:
+            self.negative_hits += 1
+        return value
+
+    def set(self, path: str, value: dict | bool):
+        ttl = self.ttl if value else self.negative_ttl
+        self.pop(path)
+        self.data[path] = (time.monotonic() + ttl, value)
+        if value:
+            self.hashes[value["HASH"]] = path
+        while len(self.data) > self.maxsize:
+            self.pop(next(iter(self.data)))
+            self.evictions += 1
+
+    def pop(self, path: str):
+        item = self.data.pop(path, None)
+        if item is not None and item[1]:
+            self.hashes.pop(item[1]["HASH"], None)
+
+    def invalidate_hash(self, hash: str):
+        path = self.hashes.get(hash)
+        if path is not None:
+            self.pop(path)
+
+    def clear(self):
+        self.data.clear()
+        self.hashes.clear()
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negativeHits": self.negative_hits,
+            "evictions": self.evictions,
+            "hitRate": self.hits / total if total else 0,
+        }
+
+
+# 将普通可迭代对象与异步可迭代对象统一为异步迭代
+async def aiter_files(files):
+    if hasattr(files, "__aiter__"):
+        async for file in files:
+            yield file
+    else:
+        for file in files:
+            yield file
 
 
 class FilesDB:
-    def __init__(self):
-        self.conn = None
-        self.cursor = None
+    path = "./data/database.db"
+    version = 0  # FILELIST 每次变更后递增，用于判断文件列表快照是否过期
+
+    def __init__(self, pool: FilesDBPool | None = None):
+        self.pool = pool or filesdb_pool
 
     async def __aenter__(self):
         await self.connect()
@@ -17,33 +255,16 @@ class FilesDB:
         await self.close()
 
     async def connect(self):
-        if not os.path.exists("./data/database.db"):
-            raise FileNotFoundError("数据库文件不存在")
-        self.conn = await aiosqlite.connect("./data/database.db")
-        self.cursor = await self.conn.cursor()
+        if not self.pool.opened:
+            await self.pool.open()
 
+    # 连接由连接池持有，这里无需关闭
     async def close(self):
-        if self.conn:
-            await self.conn.close()
-        self.conn = None
-        self.cursor = None
+        pass
 
     async def create_table(self):
-        await self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS FILELIST
-            (
-                HASH TEXT PRIMARY KEY,
-                PATH TEXT,
-                URL TEXT,
-                SIZE INTEGER,
-                MTIME INTEGER,
-                SOURCE TEXT
-            )
-        """
-        )
-        await self.conn.commit()
-        await self.close()
+        async with self.pool.writer() as conn:
+            await migrate(conn)
 
     async def new_file(
         self,
@@ -54,10 +275,38 @@ class FilesDB:
         mtime: int = 0,
         source: str = "local",
     ):
-        await self.connect()
-        await self.conn.execute(
-            """
-            INSERT INTO FILELIST (
+        async with self.pool.writer() as conn:
+            await conn.execute(
+                """
+                INSERT INTO FILELIST (
+                    HASH,
+                    PATH,
+                    URL,
+                    SIZE,
+                    MTIME,
+                    SOURCE
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    hash,
+                    path,
+                    url,
+                    size,
+                    mtime,
+                    source,
+                ),
+            )
+            await conn.execute(BUMP_VERSION)
+            await conn.commit()
+        FilesDB.version += 1
+        filemeta_cache.pop(path)
+        return True
+
+    # 批量写入文件记录，files 可以是普通可迭代对象或异步生成器
+    # 每条记录为包含 hash/path/url/size/mtime/source 的字典，每 batch_size 条提交一次
+    async def insert_many(self, files, batch_size: int = 5000, replace: bool = False):
+        sql = f"""
+            INSERT {"OR REPLACE " if replace else ""}INTO FILELIST (
                 HASH,
                 PATH,
                 URL,
@@ -65,56 +314,274 @@ class FilesDB:
                 MTIME,
                 SOURCE
             ) VALUES (?, ?, ?, ?, ?, ?)
-        """,
-            (
-                hash,
-                path,
-                url,
-                size,
-                mtime,
-                source,
-            ),
-        )
-        await self.conn.commit()
-        return True
+        """
+        total = 0
+        batch = []
+        start = time.perf_counter()
+
+        async def flush():
+            async with self.pool.writer() as conn:
+                await conn.executemany(sql, batch)
+                await conn.execute(BUMP_VERSION)
+                await conn.commit()
+            FilesDB.version += 1
+            for row in batch:
+                filemeta_cache.invalidate_hash(row[0])
+                filemeta_cache.pop(row[1])
+            batch.clear()
+
+        async for file in aiter_files(files):
+            batch.append(
+                (
+                    file["hash"],
+                    file.get("path", ""),
+                    file.get("url", ""),
+                    file.get("size", 0),
+                    file.get("mtime", 0),
+                    file.get("source", "local"),
+                )
+            )
+            total += 1
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else 0
+        logger.debug(f"批量写入 {total} 条文件记录，耗时 {elapsed:.2f}s，{rate:.0f} 条/秒")
+        return {"rows": total, "elapsed": elapsed, "rate": rate}
+
+    async def upsert_many(self, files, batch_size: int = 5000):
+        return await self.insert_many(files, batch_size, replace=True)
 
     async def delete_file(self, hash: str):
-        await self.conn.execute(
-            """
-            DELETE FROM FILELIST WHERE HASH = ?
-        """,
-            (hash,),
-        )
-        await self.conn.commit()
+        async with self.pool.writer() as conn:
+            await conn.execute(
+                """
+                DELETE FROM FILELIST WHERE HASH = ?
+            """,
+                (hash,),
+            )
+            await conn.execute(BUMP_VERSION)
+            await conn.commit()
+        FilesDB.version += 1
+        filemeta_cache.invalidate_hash(hash)
         return True
 
     async def delete_all(self):
-        await self.conn.execute(
-            """
-            DELETE FROM FILELIST
-        """,
-        )
-        await self.conn.commit()
+        async with self.pool.writer() as conn:
+            await conn.execute(
+                """
+                DELETE FROM FILELIST
+            """,
+            )
+            await conn.execute(BUMP_VERSION)
+            await conn.commit()
+        FilesDB.version += 1
+        filemeta_cache.clear()
         return True
 
+    # 批量删除指定 PATH 的文件记录
+    async def delete_paths(self, paths, batch_size: int = 5000):
+        paths = list(paths)
+        for i in range(0, len(paths), batch_size):
+            batch = [(path,) for path in paths[i : i + batch_size]]
+            async with self.pool.writer() as conn:
+                await conn.executemany("DELETE FROM FILELIST WHERE PATH = ?", batch)
+                await conn.execute(BUMP_VERSION)
+                await conn.commit()
+            FilesDB.version += 1
+        filemeta_cache.clear()
+        return len(paths)
+
+    # 返回指定来源的全部 (PATH, HASH)
+    async def get_entries(self, source: str = "local"):
+        async with self.pool.reader() as conn:
+            async with conn.execute(
+                "SELECT PATH, HASH FROM FILELIST WHERE SOURCE = ?", (source,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+        return set(rows)
+
+    async def delete_entries(self, entries, batch_size: int = 5000):
+        entries = list(entries)
+        for i in range(0, len(entries), batch_size):
+            async with self.pool.writer() as conn:
+                await conn.executemany(
+                    "DELETE FROM FILELIST WHERE PATH = ? AND HASH = ?",
+                    entries[i : i + batch_size],
+                )
+                await conn.execute(BUMP_VERSION)
+                await conn.commit()
+            FilesDB.version += 1
+        if entries:
+            filemeta_cache.clear()
+        return len(entries)
+
+    # 查询哈希缓存，返回 PATH -> (SIZE, MTIME, INODE, HASH, {算法: 摘要})
+    async def find_hashes(self, paths: list, batch_size: int = 500):
+        result = {}
+        async with self.pool.reader() as conn:
+            for i in range(0, len(paths), batch_size):
+                batch = paths[i : i + batch_size]
+                async with conn.execute(
+                    f"SELECT * FROM HASHCACHE WHERE PATH IN ({','.join('?' * len(batch))})",
+                    batch,
+                ) as cursor:
+                    for path, size, mtime, inode, hash, digests in await cursor.fetchall():
+                        result[path] = (size, mtime, inode, hash, json.loads(digests))
+        return result
+
+    # 写入哈希缓存，每条记录为 (PATH, SIZE, MTIME, INODE, HASH, DIGESTS)
+    async def put_hashes(self, rows: list):
+        if not rows:
+            return
+        async with self.pool.writer() as conn:
+            await conn.executemany(
+                "INSERT OR REPLACE INTO HASHCACHE VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            await conn.commit()
+
+    async def delete_hashes(self, paths, batch_size: int = 5000):
+        paths = list(paths)
+        for i in range(0, len(paths), batch_size):
+            batch = [(path,) for path in paths[i : i + batch_size]]
+            async with self.pool.writer() as conn:
+                await conn.executemany("DELETE FROM HASHCACHE WHERE PATH = ?", batch)
+                await conn.commit()
+        return len(paths)
+
+    # 在哈希缓存中查找 FILELIST 已没有记录的 HASH，每个 HASH 返回一个仍存在的文件
+    # HASH -> (PATH, SIZE, MTIME)
+    async def find_orphaned_hashes(self, hashes, batch_size: int = 500):
+        hashes = list(hashes)
+        result = {}
+        async with self.pool.reader() as conn:
+            for i in range(0, len(hashes), batch_size):
+                batch = hashes[i : i + batch_size]
+                async with conn.execute(
+                    f"""
+                    SELECT HASH, PATH, SIZE, MTIME FROM HASHCACHE
+                    WHERE HASH IN ({','.join('?' * len(batch))})
+                    AND NOT EXISTS (SELECT 1 FROM FILELIST WHERE FILELIST.HASH = HASHCACHE.HASH)
+                """,
+                    batch,
+                ) as cursor:
+                    for hash, path, size, mtime in await cursor.fetchall():
+                        result.setdefault(hash, (path, size, mtime))
+        return result
+
+    async def get_cached_paths(self):
+        async with self.pool.reader() as conn:
+            async with conn.execute("SELECT PATH FROM HASHCACHE") as cursor:
+                rows = await cursor.fetchall()
+        return {row[0] for row in rows}
+
+    # 持久化的 FILELIST 数据版本，跨进程重启保持递增
+    async def data_version(self) -> int:
+        async with self.pool.reader() as conn:
+            async with conn.execute(DATA_VERSION) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def fetch_one(self, sql: str, value: str):
+        async with self.pool.reader() as conn:
+            async with conn.execute(sql, (value,)) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    columns = [desc[0] for desc in cursor.description]
+                    result = dict(zip(columns, row))
+                else:
+                    result = False
+        return result
+
+    async def find_by_hash(self, hash: str):
+        return await self.fetch_one(FIND_BY_HASH, hash)
+
+    async def find_by_path(self, path: str):
+        result = filemeta_cache.get(path)
+        if result is None:
+            version = FilesDB.version
+            result = await self.fetch_one(FIND_BY_PATH, path)
+            # 查询期间 FILELIST 发生变化时不写入缓存，避免缓存过期结果
+            if version == FilesDB.version:
+                filemeta_cache.set(path, result)
+        return result
+
     async def find_one(self, key: str, value: str):
-        async with self.conn.execute(
-            f"""
-            SELECT * FROM FILELIST WHERE {key} = ?
-        """,
-            (value,),
-        ) as cursor:
-            row = await cursor.fetchone()
-            if row:
+        if key not in COLUMNS:
+            raise ValueError(f"未知的字段: {key}")
+        return await self.fetch_one(f"SELECT * FROM FILELIST WHERE {key} = ?", value)
+
+    # 随机取一条文件记录，按 rowid 定位，避免 ORDER BY RANDOM() 全表排序
+    async def random_file(self):
+        async with self.pool.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT * FROM FILELIST WHERE rowid >= (
+                    SELECT abs(random()) % (MAX(rowid) + 1) FROM FILELIST
+                ) LIMIT 1
+            """
+            ) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    columns = [desc[0] for desc in cursor.description]
+                    return dict(zip(columns, row))
+        return False
+
+    async def get_all(self):
+        async with self.pool.reader() as conn:
+            async with conn.execute("SELECT * FROM FILELIST") as cursor:
+                rows = await cursor.fetchall()
                 columns = [desc[0] for desc in cursor.description]
-                result = dict(zip(columns, row))
-            else:
-                result = False
+                result = [dict(zip(columns, row)) for row in rows]
         return result
 
-    async def get_all(self):
-        async with self.conn.execute("SELECT * FROM FILELIST") as cursor:
-            rows = await cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            result = [dict(zip(columns, row)) for row in rows]
-        return result
\ No newline at end of file
+    async def count(self, mtime: int | None = None):
+        if mtime is None:
+            sql, params = "SELECT COUNT(*) FROM FILELIST", ()
+        else:
+            sql, params = "SELECT COUNT(*) FROM FILELIST WHERE MTIME > ?", (mtime,)
+        async with self.pool.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                row = await cursor.fetchone()
+        return row[0]
+
+    # 最小的 MTIME，FILELIST 为空时返回 None；MTIME 有索引，无需扫描全表
+    async def min_mtime(self):
+        async with self.pool.reader() as conn:
+            async with conn.execute("SELECT MIN(MTIME) FROM FILELIST") as cursor:
+                row = await cursor.fetchone()
+        return row[0]
+
+    # 在同一个读事务中先产出 (文件数量, 最大 MTIME)，随后按块产出文件记录；
+    # 迭代期间一直占用连接池中的读连接，调用方不应在迭代中等待网络等慢操作
+    async def iter_files(self, mtime: int | None = None, chunk_size: int = 10000):
+        if mtime is None:
+            where, params = "", ()
+        else:
+            where, params = "WHERE MTIME > ?", (mtime,)
+        async with self.pool.reader() as conn:
+            await conn.execute("BEGIN")
+            try:
+                async with conn.execute(
+                    f"SELECT COUNT(*), MAX(MTIME) FROM FILELIST {where}", params
+                ) as cursor:
+                    count, lastModified = await cursor.fetchone()
+                yield count, lastModified or 0
+                async with conn.execute(
+                    f"SELECT * FROM FILELIST {where}", params
+                ) as cursor:
+                    columns = [desc[0] for desc in cursor.description]
+                    while rows := await cursor.fetchmany(chunk_size):
+                        yield [dict(zip(columns, row)) for row in rows]
+            finally:
+                await conn.execute("COMMIT")
+
+
+filesdb_pool = FilesDBPool(FilesDB.path, int(config.get("filesdb.readers", 4)))
+filemeta_cache = FileMetaCache(
+    int(config.get("filecache.size", 10000)),
+    float(config.get("filecache.ttl", 300)),
+    float(config.get("filecache.negative_ttl", 30)),
+)
@@ -0,0 +1,124 @@
+# 第三方库
+import os
+import mmap
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 本地库
+from core.config import config
+
+# 每个线程复用一块读取缓冲区
+_local = threading.local()
+
+
+def get_buffer(size: int) -> bytearray:
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = _local.buffer = bytearray(size)
+    return buffer
+
+
+# 一次读取同时计算多种摘要，返回 ({算法: 摘要}, 大小, 修改时间（纳秒）, inode)
+# 大文件使用 mmap 直接送入 hashlib，小文件读入线程内复用的缓冲区；
+# 每次 update 的数据都远大于 2KB，hashlib 会在计算时释放 GIL
+def hash_file(
+    path: str,
+    algorithms: tuple = ("sha1",),
+    chunk_size: int = 1024 * 1024,
+    mmap_threshold: int = 8 * 1024 * 1024,
+):
+    digests = [hashlib.new(name) for name in algorithms]
+    with open(path, "rb", buffering=0) as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size >= mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), chunk_size):
+                        chunk = view[offset : offset + chunk_size]
+                        for digest in digests:
+                            digest.update(chunk)
+                        chunk.release()
+                finally:
+                    view.release()
+        else:
+            buffer = get_buffer(chunk_size)
+            view = memoryview(buffer)
+            while size := f.readinto(buffer):
+                chunk = view[:size]
+                for digest in digests:
+                    digest.update(chunk)
+    return (
+        {name: digest.hexdigest() for name, digest in zip(algorithms, digests)},
+        stat.st_size,
+        stat.st_mtime_ns,
+        stat.st_ino,
+    )
+
+
+# 多摘要哈希引擎，在线程池中并发计算；第一个算法为主摘要（OpenBMCLAPI 使用 sha1）
+class HashEngine:
+    def __init__(
+        self,
+        algorithms: list | None = None,
+        workers: int | None = None,
+        chunk_size: int = 1024 * 1024,
+        mmap_threshold: int = 8 * 1024 * 1024,
+    ):
+        self.algorithms = tuple(dict.fromkeys(["sha1", *(algorithms or [])]))
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.mmap_threshold = mmap_threshold
+        self.executor = None
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="hash"
+            )
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def hash_file(self, path: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.get_executor(),
+            hash_file,
+            path,
+            self.algorithms,
+            self.chunk_size,
+            self.mmap_threshold,
+        )
+
+    # 保持固定数量的任务在线程池中，按完成顺序产出 (相对路径, 结果或异常)
+    async def hash_many(self, root: str, paths):
+        pending = {}  # Task -> 相对路径
+        paths = iter(paths)
+        while True:
+            for path in paths:
+                pending[asyncio.ensure_future(self.hash_file(os.path.join(root, path)))] = path
+                if len(pending) >= self.workers * 4:
+                    break
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    yield path, future.result()
+                except OSError as e:
+                    yield path, e
+
+
+hash_engine = HashEngine(
+    config.get("sync.digests"),
+    config.get("sync.workers"),
+    int(config.get("sync.chunk_size", 1024 * 1024)),
+    int(config.get("sync.mmap_threshold", 8 * 1024 * 1024)),
+)
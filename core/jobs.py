@@ -0,0 +1,80 @@
+# 第三方库
+import time
+import asyncio
+from collections import deque
+
+# 本地库
+from core.config import config
+from core.logger import logger
+
+
+# 有界并发的异步任务队列，提交者等待结果时不会阻塞事件循环
+class JobQueue:
+    def __init__(self, name: str, concurrency: int = 16):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = asyncio.Queue()
+        self.workers = []
+        # 统计信息
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.finished = deque()  # 最近 60 秒内完成任务的时间
+
+    def start(self):
+        if not self.workers:
+            self.workers = [
+                asyncio.create_task(self.worker()) for _ in range(self.concurrency)
+            ]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, func, *args):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((func, args, future))
+        return await future
+
+    async def worker(self):
+        while True:
+            func, args, future = await self.queue.get()
+            start = time.perf_counter()
+            self.running += 1
+            try:
+                result = await func(*args)
+                if not future.done():
+                    future.set_result(result)
+                self.completed += 1
+            except Exception as e:
+                logger.error(f"{self.name} 任务执行失败: {e}")
+                if not future.done():
+                    future.set_exception(e)
+                self.failed += 1
+            finally:
+                self.running -= 1
+                self.total_time += time.perf_counter() - start
+                self.finished.append(time.monotonic())
+                self.queue.task_done()
+
+    def metrics(self):
+        now = time.monotonic()
+        while self.finished and self.finished[0] < now - 60:
+            self.finished.popleft()
+        done = self.completed + self.failed
+        return {
+            "concurrency": self.concurrency,
+            "queued": self.queue.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avgDuration": self.total_time / done if done else 0,
+            "perMinute": len(self.finished),
+        }
+
+
+enable_queue = JobQueue("节点上线", int(config.get("enable.concurrency", 16)))
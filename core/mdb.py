@@ -1,9 +1,12 @@
 # 第三方库
+import asyncio
 import motor.motor_asyncio
 from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
 
 # 本地库
 from core.config import config
+from core.logger import logger
 
 
 def to_objectId(id: str):
@@ -84,6 +87,7 @@ class Database:
         secret: str = None,
         bandwidth: int = None,
         measureBandwidth: int = None,
+        measureBandwidthP10: int = None,
         trust: int = None,
         isBanned: bool = None,
         ban_reason: str = None,
@@ -100,6 +104,7 @@ class Database:
             "secret": secret,
             "bandwidth": bandwidth,
             "measureBandwidth": measureBandwidth,
+            "measureBandwidthP10": measureBandwidthP10,
             "trust": trust,
             "isBanned": isBanned,
             "ban_reason": ban_reason,
@@ -121,10 +126,90 @@ class Database:
         return False
 
 
+
+# 节点信息的进程内缓存：启动时一次性加载，读取走内存，写入同时更新 MongoDB
+# 通过 Change Stream 保持与数据库一致，不支持时（非副本集）退化为定时轮询
+class ClusterRegistry:
+    def __init__(self, database: Database, poll_interval: float = 30):
+        self.database = database
+        self.poll_interval = poll_interval
+        self.clusters = {}  # cluster_id -> 文档
+        self.loaded = False
+        self.task = None
+
+    async def load(self):
+        docs = await self.database.get_all()
+        self.clusters = {str(doc["_id"]): doc for doc in docs}
+        self.loaded = True
+
+    async def start(self):
+        try:
+            await self.load()
+        except PyMongoError as e:
+            logger.warning(f"加载节点缓存失败，将在首次访问时重试: {e}")
+        self.task = asyncio.create_task(self.watch())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def watch(self):
+        collection = await self.database.collection(self.database.collection_name)
+        try:
+            async with collection.watch(full_document="updateLookup") as stream:
+                logger.debug("节点缓存已通过 Change Stream 与数据库同步")
+                async for change in stream:
+                    self.apply_change(change)
+        except PyMongoError as e:
+            logger.debug(f"无法使用 Change Stream（{e}），改为每 {self.poll_interval}s 轮询一次")
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.load()
+            except PyMongoError as e:
+                logger.warning(f"刷新节点缓存失败: {e}")
+
+    def apply_change(self, change: dict):
+        cluster_id = str(change["documentKey"]["_id"])
+        if change["operationType"] == "delete":
+            self.clusters.pop(cluster_id, None)
+        elif change.get("fullDocument") is not None:
+            self.clusters[cluster_id] = change["fullDocument"]
+
+    async def find_cluster(self, id: str):
+        if not self.loaded:
+            await self.load()
+        doc = self.clusters.get(id)
+        if doc is not None:
+            return [True, doc]
+        # 缓存中没有时回源查询，以便及时发现新创建的节点
+        result = await self.database.find_cluster(id)
+        if result[0]:
+            self.clusters[id] = result[1]
+        return result
+
+    async def get_all(self):
+        if not self.loaded:
+            await self.load()
+        return [dict(doc) for doc in self.clusters.values()]
+
+    async def edit_cluster(self, id: str, **kwargs):
+        result = await self.database.edit_cluster(id, **kwargs)
+        if result and id in self.clusters:
+            self.clusters[id].update({k: v for k, v in kwargs.items() if v is not None})
+        return result
+
+
 cdb = Database(
     config.get("mongodb.url"),
     config.get("mongodb.db_name"),
     "clusters",
     config.get("mongodb.username"),
     config.get("mongodb.password"),
-)
\ No newline at end of file
+)
+cluster_registry = ClusterRegistry(cdb, float(config.get("mongodb.poll_interval", 30)))
@@ -0,0 +1,88 @@
+# 第三方库
+import time
+import httpx
+import asyncio
+import statistics
+
+# 本地库
+import core.const as const
+import core.utils as utils
+from core.config import config
+from core.types import Cluster
+
+
+# 取有序样本的分位数（线性插值）
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    pos = (len(values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+# 节点测速引擎：复用连接池，流式读取并校验数据量，多次采样取中位数与 p10
+class MeasureEngine:
+    def __init__(
+        self,
+        samples: int = 3,
+        timeout: float = 20,
+        connect_timeout: float = 5,
+        deadline: float = 60,
+    ):
+        self.samples = samples
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.client = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                headers={"User-Agent": const.user_agent},
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=256, max_keepalive_connections=64),
+            )
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    # 单次采样，返回带宽（Mbps）；计时从收到响应头开始，不包含建立连接与 TLS 握手
+    async def sample(self, cluster: Cluster, size: int) -> float:
+        path = f"/measure/{str(size)}"
+        sign = utils.get_sign(path, cluster.secret)
+        url = utils.get_url(cluster.host, cluster.port, path, sign)
+        async with self.get_client().stream("GET", url) as response:
+            response.raise_for_status()
+            received = 0
+            start = time.perf_counter()
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+            elapsed = time.perf_counter() - start
+        expected = size * 1024 * 1024
+        if received < expected:
+            raise ValueError(f"测速数据不完整: 收到 {received}B，应为 {expected}B")
+        return received / 1024 / 1024 * 8 / max(elapsed, 1e-6)
+
+    async def measure(self, cluster: Cluster, size: int = 10):
+        results = []
+        async with asyncio.timeout(self.deadline):
+            for _ in range(self.samples):
+                results.append(await self.sample(cluster, size))
+        return {
+            "median": statistics.median(results),
+            "p10": percentile(results, 0.1),
+            "samples": results,
+        }
+
+
+measure_engine = MeasureEngine(
+    int(config.get("measure.samples", 3)),
+    float(config.get("measure.timeout", 20)),
+    float(config.get("measure.connect_timeout", 5)),
+    float(config.get("measure.deadline", 60)),
+)
@@ -0,0 +1,156 @@
+# 第三方库
+import time
+import random
+import asyncio
+from contextlib import contextmanager
+
+# 本地库
+import core.utils as utils
+from core.types import oclm, Cluster
+from core.logger import logger
+from core.config import config
+from core.filesdb import FilesDB
+from core.measure import measure_engine
+
+
+# 在线节点的周期性健康检查与重新测速
+# 每轮把所有在线节点随机打散并均匀分布在 interval 内，带抖动，全局并发受 concurrency 限制
+class Prober:
+    def __init__(
+        self,
+        interval: float = 600,
+        jitter: float = 0.2,
+        concurrency: int = 4,
+        size: int = 1,
+        max_failures: int = 3,
+        smoothing: float = 0.3,
+    ):
+        self.interval = interval
+        self.jitter = jitter
+        self.size = size
+        self.max_failures = max_failures
+        self.smoothing = smoothing  # 新测速结果在加权平均中的占比
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.failures = {}  # cluster_id -> 连续失败次数
+        self.tasks = set()
+        self.task = None
+        # 统计信息
+        self.probes = 0
+        self.failed = 0
+        self.removed = 0
+        self.bytes = 0
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+
+    # 累计探测器自身同步代码（调度、签名、结果处理）消耗的线程 CPU 时间；
+    # 只包住不含 await 的代码段，因此不会计入事件循环上交错执行的其他协程
+    @contextmanager
+    def cpu(self):
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.cpu_time += time.thread_time() - start
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(self.task, *self.tasks, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            with self.cpu():
+                clusters = list(oclm.clusters.values())
+                random.shuffle(clusters)
+                spacing = self.interval / max(len(clusters), 1)
+            if not clusters:
+                await asyncio.sleep(spacing)
+            for cluster in clusters:
+                await asyncio.sleep(
+                    spacing * random.uniform(1 - self.jitter, 1 + self.jitter)
+                )
+                if not oclm.include(cluster.id):
+                    continue
+                await self.semaphore.acquire()
+                task = asyncio.create_task(self.probe(oclm.get(cluster.id)))
+                self.tasks.add(task)
+                task.add_done_callback(self.done)
+
+    def done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self.semaphore.release()
+
+    # 使用已签名的下载请求检查节点能否正常提供文件，只读取响应头
+    async def check_download(self, cluster: Cluster):
+        async with FilesDB() as filesdb:
+            file = await filesdb.random_file()
+        if not file:
+            return
+        with self.cpu():
+            sign = utils.get_sign(file["HASH"], cluster.secret)
+            url = utils.get_url(cluster.host, cluster.port, f"/download/{file['HASH']}", sign)
+        async with measure_engine.get_client().stream("GET", url) as response:
+            if response.status_code >= 400:
+                raise ValueError(f"下载检查失败: HTTP {response.status_code}")
+
+    async def probe(self, cluster: Cluster):
+        wall_start = time.perf_counter()
+        self.probes += 1
+        try:
+            # 与上线测速使用同一个总时限，持续慢速返回数据的节点不会一直占用探测名额
+            async with asyncio.timeout(measure_engine.deadline):
+                bandwidth = await measure_engine.sample(cluster, self.size)
+                self.bytes += self.size * 1024 * 1024
+                await self.check_download(cluster)
+        except Exception as e:
+            with self.cpu():
+                self.failed += 1
+                failures = self.failures.get(cluster.id, 0) + 1
+                self.failures[cluster.id] = failures
+                logger.debug(f"节点 {cluster.id} 健康检查失败（{failures}/{self.max_failures}）: {repr(e)}")
+                if failures >= self.max_failures and oclm.include(cluster.id):
+                    oclm.remove(cluster.id)
+                    self.failures.pop(cluster.id, None)
+                    self.removed += 1
+                    logger.warning(f"节点 {cluster.id} 连续 {failures} 次健康检查失败，已移出在线列表")
+            return
+        finally:
+            self.wall_time += time.perf_counter() - wall_start
+        with self.cpu():
+            self.failures.pop(cluster.id, None)
+            measured = bandwidth
+            if cluster.measureBandwidth > 0:
+                measured = (
+                    self.smoothing * bandwidth
+                    + (1 - self.smoothing) * cluster.measureBandwidth
+                )
+        if int(measured) != cluster.measureBandwidth:
+            await cluster.edit(measureBandwidth=int(measured))
+
+    def metrics(self):
+        return {
+            "online": len(oclm),
+            "running": len(self.tasks),
+            "probes": self.probes,
+            "failed": self.failed,
+            "removed": self.removed,
+            "bytes": self.bytes,
+            "cpuTime": self.cpu_time,
+            "wallTime": self.wall_time,
+        }
+
+
+prober = Prober(
+    float(config.get("prober.interval", 600)),
+    float(config.get("prober.jitter", 0.2)),
+    int(config.get("prober.concurrency", 4)),
+    int(config.get("prober.size", 1)),
+    int(config.get("prober.max_failures", 3)),
+)
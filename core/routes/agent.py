@@ -21,7 +21,7 @@ async def get_challenge(response: Response, clusterId: str | None = ""):
             "challenge": utils.encode_jwt(
                 {
                     "cluster_id": clusterId,
-                    "cluster_secret": cluster.secret,
+                    "typ": "challenge",  # JWT 载荷是明文，不能携带 secret
                     "iss": const.jwt_iss,
                     "exp": int(time.time()) + 1000 * 60 * 5,
                 }
@@ -68,6 +68,7 @@ async def post_token(request: Request):
                         {
                             "cluster_id": clusterId,
                             "cluster_secret": cluster.secret,
+                            "typ": "token",
                             "iss": const.jwt_iss,
                             "exp": int(time.time()) + ttl,
                         }
@@ -4,7 +4,14 @@ from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse
 
 # 本地库
 from core.types import oclm
-from core.mdb import cdb
+from core.mdb import cluster_registry
+from core.filesdb import filesdb_pool, filemeta_cache
+from core.jobs import enable_queue
+from core.prober import prober
+from core.sync import sync_pipeline
+from core.emergency import emergency_server
+from core.upstream import upstream_cache
+from core.dns.certificate import cert_service
 
 
 router = APIRouter()
@@ -34,10 +41,24 @@ async def get_dashboard_data():
     }
 
 
+@router.get("/metrics")
+async def get_metrics_data():
+    return {
+        "filesdb": filesdb_pool.metrics(),
+        "filecache": filemeta_cache.metrics(),
+        "enable": enable_queue.metrics(),
+        "prober": prober.metrics(),
+        "keypool": cert_service.key_pool.metrics(),
+        "sync": sync_pipeline.metrics(),
+        "emergency": emergency_server.metrics(),
+        "upstream": upstream_cache.metrics(),
+    }
+
+
 @router.get("/rank")
 async def get_rank_data():
     result = []
-    all_data = await cdb.get_all()
+    all_data = await cluster_registry.get_all()
     for data in all_data:
         data["_id"] = str(data["_id"])
         if oclm.include(data["_id"]):
@@ -1,13 +1,14 @@
 # 第三方库
-import pyzstd
 from pathlib import Path
 from fastapi import APIRouter, Request, HTTPException, Response
-from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 
 # 本地库
-from core.types import Avro
 from core.logger import logger
+from core.filelist import filelist, filelist_snapshot, FileListStream
 from core.filesdb import FilesDB
+from core.emergency import emergency_server
+from core.upstream import upstream_cache
 
 
 router = APIRouter()
@@ -20,25 +21,47 @@ def get_configuration(response: Response):
 
 
 @router.get("/files", summary="文件列表", tags=["nodes"])
-async def get_filesList():
-    async with FilesDB() as filesdb:
-        filelist = await filesdb.get_all()
-    avro = Avro()
-    avro.writeVarInt(len(filelist))  # 写入文件数量
-    for file in filelist:
-        avro.writeString(f"/{file['SOURCE']}/{file['HASH']}")  # 路径
-        avro.writeString(file['HASH'])  # 哈希
-        avro.writeVarInt(file['SIZE'])  # 文件大小
-        avro.writeVarInt(file['MTIME'])  # 修改时间
-    avro.write(b"\x00")
-    result = pyzstd.compress(avro.io.getvalue())
-    avro.io.close()
-    return HTMLResponse(content=result, media_type="application/octet-stream")
+async def get_filesList(request: Request, lastModified: int | None = None):
+    if lastModified is not None:
+        stream = await filelist.delta(lastModified)
+        if stream is None:
+            return Response(status_code=204)
+        if stream is not filelist:  # 覆盖全表时直接返回快照
+            return StreamingResponse(stream, media_type="application/octet-stream")
+    elif not filelist_snapshot:
+        return StreamingResponse(FileListStream(), media_type="application/octet-stream")
+    snapshot = await filelist.get()
+    headers = {"ETag": snapshot.etag}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=snapshot.content,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
 
 
 @router.get("/download/{hash}", summary="应急同步", tags=["nodes"])
-async def download_file_from_ctrl(hash: str):
-    raise HTTPException(404, detail="未找到该文件")
+async def download_file_from_ctrl(request: Request, hash: str):
+    cluster_id = await emergency_server.authorize(request)
+    async with FilesDB() as filesdb:
+        filedata = await filesdb.find_by_hash(hash)
+    if not filedata:
+        raise HTTPException(404, detail="未找到该文件")
+    if filedata["SOURCE"] == "local":
+        path = emergency_server.resolve(filedata["PATH"])
+    elif filedata["URL"]:
+        # 不在本地镜像中的文件通过上游缓存获取
+        path = upstream_cache.open(hash, filedata["URL"], filedata["SIZE"])
+        if not isinstance(path, str):
+            return await emergency_server.serve_stream(
+                request, cluster_id, path, hash, filedata["SIZE"]
+            )
+    else:
+        path = None
+    if path is None:
+        raise HTTPException(404, detail="未找到该文件")
+    return await emergency_server.serve(request, cluster_id, path, hash)
 
 
 @router.post("/report", summary="上报异常", tags=["nodes"])
@@ -1,29 +1,43 @@
 # 第三方库
 from pathlib import Path
 from fastapi import APIRouter, Request, HTTPException, Response
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 
 # 本地库
-from random import choice
 import core.utils as utils
-from core.types import oclm, Cluster
+from core.types import oclm
 from core.logger import logger
 from core.filesdb import FilesDB
+from core.upstream import upstream_cache
 
 router = APIRouter()
 
 
-@router.get("/files/{path}", summary="通过 PATH 下载普通文件", tags=["public"])
-async def download_path_file(hash: str):
+@router.get("/files/{path:path}", summary="通过 PATH 下载普通文件", tags=["public"])
+async def download_path_file(path: str):
     async with FilesDB() as filesdb:
-        filedata = await filesdb.find_one("PATH", hash)
+        filedata = await filesdb.find_by_path(path)
 
     if filedata:
         if len(oclm) == 0:
+            if filedata["SOURCE"] != "local" and filedata["URL"]:
+                # 没有在线节点时由主控从上游缓存提供文件
+                result = upstream_cache.open(
+                    filedata["HASH"], filedata["URL"], filedata["SIZE"]
+                )
+                if isinstance(result, str):
+                    return FileResponse(result, headers={"ETag": f'"{filedata["HASH"]}"'})
+                headers = {"ETag": f'"{filedata["HASH"]}"'}
+                if filedata["SIZE"]:
+                    headers["Content-Length"] = str(filedata["SIZE"])
+                return StreamingResponse(
+                    await upstream_cache.prime(result),
+                    headers=headers,
+                    media_type="application/octet-stream",
+                )
             return RedirectResponse(filedata["URL"], 302)
         else:
-            cluster = Cluster(choice(oclm.list))
-            await cluster.initialize()
+            cluster = oclm.select(filedata["HASH"])
             sign = utils.get_sign(filedata["HASH"], cluster.secret)
             url = utils.get_url(
                 cluster.host, cluster.port, f"/download/{filedata['HASH']}", sign
@@ -1,34 +1,249 @@
-from git.repo import Repo
-from core.config import config
+# 第三方库
 import os
-import hashlib
-download_path = os.path.join(config.get('download_path'))
-
-Repo.clone_from(url=config.get('git_repo.url'),to_path=download_path,branch=config.get('git_repo.branch'))
-
-
-async def generate_filelist():
-    global file_list
-    file_list = []
-    for root, dirs, files in os.walk(config.get('download_path')):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_hash = get_file_hash(file_path)
-            file_entry = {
-                "_hash": file_hash,
-                "path": file_path,
-                "name": file
+import json
+import time
+import random
+import asyncio
+from git import Repo, BadName, BadObject
+
+# 本地库
+from core.config import config
+from core.logger import logger
+from core.filesdb import FilesDB
+from core.hashing import HashEngine, hash_engine
+
+
+# 批量获取文件元数据 (大小, 修改时间（纳秒）, inode)，文件不存在时为 None
+def stat_files(root: str, paths: list):
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(os.path.join(root, path))
+            result.append((stat.st_size, stat.st_mtime_ns, stat.st_ino))
+        except OSError:
+            result.append(None)
+    return result
+
+
+# 源仓库同步：定时增量 git fetch，只对变更的文件重新计算哈希，
+# 结果按批写入 FILELIST
+class SyncPipeline:
+    def __init__(
+        self,
+        url: str | None,
+        branch: str | None,
+        path: str,
+        engine: HashEngine,
+        raw_url: str = "",
+        interval: float = 600,
+        batch_size: int = 5000,
+        state_path: str = "./data/sync.json",
+    ):
+        self.url = url
+        self.branch = branch
+        self.path = path
+        self.engine = engine
+        self.raw_url = raw_url  # 上游直链模板，{path} 会被替换为文件相对路径
+        self.interval = interval
+        self.batch_size = batch_size
+        self.state_path = state_path
+        self.repo = None
+        self.task = None
+        self.lock = asyncio.Lock()
+        self.last = {}  # 最近一次同步的统计信息
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.engine.close()
+
+    async def run(self):
+        full = True  # 启动后先做一次全量扫描，发现停机期间工作区的变化
+        while True:
+            try:
+                await self.sync(full)
+                full = False
+            except Exception as e:
+                logger.error(f"同步源仓库失败: {repr(e)}")
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+
+    def load_state(self) -> str | None:
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("commit")
+
+    def dump_state(self, commit: str):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"commit": commit}, f)
+        os.replace(temp_path, self.state_path)
+
+    # 拉取远端更新并检出，返回 (变更的文件, 删除的文件, 新提交)；首次同步时变更文件为 None
+    def fetch(self, synced: str | None):
+        if self.repo is None:
+            if os.path.isdir(os.path.join(self.path, ".git")):
+                self.repo = Repo(self.path)
+            else:
+                self.repo = Repo.clone_from(self.url, self.path, branch=self.branch)
+        origin = self.repo.remotes.origin
+        branch = self.branch or self.repo.active_branch.name
+        origin.fetch(branch)
+        commit = self.repo.commit(f"origin/{branch}")
+        self.repo.git.reset("--hard", commit.hexsha)
+        if synced is None:
+            return None, [], commit.hexsha
+        if synced == commit.hexsha:
+            return [], [], commit.hexsha
+        try:
+            diffs = self.repo.commit(synced).diff(commit)
+        except (ValueError, BadName, BadObject):
+            return None, [], commit.hexsha  # 历史被改写，退回全量同步
+        changed, deleted = [], []
+        for diff in diffs:
+            if diff.deleted_file:
+                deleted.append(diff.a_path)
+            elif diff.renamed_file:
+                deleted.append(diff.a_path)
+                changed.append(diff.b_path)
+            else:
+                changed.append(diff.b_path)
+        return changed, deleted, commit.hexsha
+
+    def scan(self):
+        return self.repo.git.ls_files("-z").split("\0")
+
+    def record(self, path: str, hash: str, size: int, mtime_ns: int) -> dict:
+        return {
+            "hash": hash,
+            "path": path,
+            "url": self.raw_url.format(path=path) if self.raw_url else "",
+            "size": size,
+            "mtime": mtime_ns // 1000000,
+            "source": "local",
+        }
+
+    # 产出文件记录：先按块 stat，元数据与哈希缓存一致的直接复用，其余的重新计算并写回缓存
+    async def hash_files(self, filesdb: FilesDB, paths: list, stats: dict, block: int = 2000):
+        for i in range(0, len(paths), block):
+            batch = paths[i : i + block]
+            metas = await asyncio.to_thread(stat_files, self.path, batch)
+            cached = await filesdb.find_hashes(batch)
+            misses = []
+            for path, meta in zip(batch, metas):
+                if meta is None:
+                    logger.warning(f"文件 {path} 不存在，已跳过")
+                    continue
+                entry = cached.get(path)
+                # 元数据一致且缓存中包含所有需要的摘要时复用
+                if (
+                    entry is not None
+                    and entry[:3] == meta
+                    and all(name in entry[4] for name in self.engine.algorithms)
+                ):
+                    stats["reused"] += 1
+                    stats["entries"].add((path, entry[3]))
+                    yield self.record(path, entry[3], meta[0], meta[1])
+                else:
+                    misses.append(path)
+            rows = []
+            async for path, result in self.engine.hash_many(self.path, misses):
+                if isinstance(result, OSError):
+                    logger.warning(f"读取文件 {path} 失败: {result}")
+                    continue
+                digests, size, mtime_ns, inode = result
+                hash = digests["sha1"]
+                stats["files"] += 1
+                stats["bytes"] += size
+                stats["entries"].add((path, hash))
+                rows.append((path, size, mtime_ns, inode, hash, json.dumps(digests)))
+                yield self.record(path, hash, size, mtime_ns)
+            await filesdb.put_hashes(rows)
+
+    # FILELIST 以 HASH 为主键，内容相同的多个文件只保留其中一个路径的记录；
+    # 按路径删除时可能删掉仍被其他路径共享的记录，这里用哈希缓存中同 HASH 的路径补回
+    async def restore_shared(self, filesdb: FilesDB, previous: dict, stats: dict) -> list:
+        orphaned = await filesdb.find_orphaned_hashes({entry[3] for entry in previous.values()})
+        records = []
+        for hash, (path, size, mtime_ns) in orphaned.items():
+            stats["entries"].add((path, hash))
+            records.append(self.record(path, hash, size, mtime_ns))
+        if records:
+            logger.debug(f"补回 {len(records)} 个与已删除文件内容相同的文件记录")
+        return records
+
+    # 同步一次；full 为真时对整个工作区做一次 stat 扫描，仅重新计算元数据变化的文件
+    async def sync(self, full: bool = False):
+        async with self.lock:
+            start = time.perf_counter()
+            synced = self.load_state()
+            changed, deleted, commit = await asyncio.to_thread(self.fetch, synced)
+            full = full or changed is None
+            async with FilesDB() as filesdb:
+                if full:
+                    changed = [path for path in await asyncio.to_thread(self.scan) if path]
+                elif not changed and not deleted:
+                    return self.last
+                else:
+                    previous = await filesdb.find_hashes(deleted + changed)
+                    # 内容变更后 HASH 不同，旧记录需要先删除
+                    await filesdb.delete_paths(deleted + changed)
+                    await filesdb.delete_hashes(deleted)
+                stats = {"files": 0, "bytes": 0, "reused": 0, "entries": set()}
+                await filesdb.upsert_many(
+                    self.hash_files(filesdb, changed, stats), self.batch_size
+                )
+                if not full:
+                    records = await self.restore_shared(filesdb, previous, stats)
+                    if records:
+                        await filesdb.upsert_many(records, self.batch_size)
+                if full:
+                    # 清理已不在工作区中的文件记录与哈希缓存
+                    await filesdb.delete_entries(
+                        await filesdb.get_entries() - stats["entries"]
+                    )
+                    await filesdb.delete_hashes(
+                        await filesdb.get_cached_paths() - set(changed)
+                    )
+            await asyncio.to_thread(self.dump_state, commit)
+            elapsed = time.perf_counter() - start
+            self.last = {
+                "commit": commit,
+                "full": full,
+                "files": stats["files"],
+                "reused": stats["reused"],
+                "bytes": stats["bytes"],
+                "elapsed": elapsed,
+                "filesPerSecond": stats["files"] / elapsed if elapsed > 0 else 0,
+                "bytesPerSecond": stats["bytes"] / elapsed if elapsed > 0 else 0,
+                "time": int(time.time()),
             }
-            file_list.append(file_entry)
-    return file_list
-
-async def get_file_hash(file_path):
-    hash_md5 = hashlib.md5()
-    with open (file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
-
-# async def write_to_db():
-#     for i in file_list:
-#         await fdb.file.insert_one(i)
\ No newline at end of file
+            logger.info(
+                f"同步完成: 提交 {commit[:8]}，计算 {stats['files']} 个文件的哈希，"
+                f"复用 {stats['reused']} 个缓存，{stats['bytes'] / 1024 / 1024:.1f}MiB，"
+                f"耗时 {elapsed:.2f}s，{self.last['filesPerSecond']:.0f} 文件/秒，"
+                f"{self.last['bytesPerSecond'] / 1024 / 1024:.1f}MiB/秒"
+            )
+            return self.last
+
+    def metrics(self):
+        return self.last
+
+
+sync_pipeline = SyncPipeline(
+    config.get("git_repo.url"),
+    config.get("git_repo.branch"),
+    os.path.join(config.get("download_path", "./files")),
+    hash_engine,
+    config.get("git_repo.raw_url", ""),
+    float(config.get("sync.interval", 600)),
+    int(config.get("sync.batch_size", 5000)),
+    config.get("sync.state_path", "./data/sync.json"),
+)
@@ -1,7 +1,17 @@
 import io
 import heapq
+import random
+import time
+import bisect
+import struct
+import hashlib
+from collections import deque
 from typing import Optional
-from core.mdb import cdb
+from core.config import config
+from core.mdb import cluster_registry
+
+
+scheduler_policy = config.get("scheduler.policy", "wrr")  # wrr、random、p2c 或 hash
 
 
 class Cluster:
@@ -9,13 +19,14 @@ class Cluster:
         self.id = cluster_id
 
     async def initialize(self):
-        data = await cdb.find_cluster(self.id)
+        data = await cluster_registry.find_cluster(self.id)
         if data[0]:
             # 正常数据
             self.name = str(data[1]["name"])
             self.secret = str(data[1]["secret"])
             self.bandwidth = int(data[1]["bandwidth"])
             self.measureBandwidth = int(data[1].get("measureBandwidth", 0))
+            self.measureBandwidthP10 = int(data[1].get("measureBandwidthP10", 0))
             self.trust = int(data[1].get("trust", 0))
             self.isBanned = bool(data[1].get("isBanned", False))
             self.ban_reason = str(data[1].get("ban_reason", ""))
@@ -37,6 +48,7 @@ class Cluster:
         secret: str = None,
         bandwidth: int = None,
         measureBandwidth: int = None,
+        measureBandwidthP10: int = None,
         trust: int = None,
         isBanned: bool = None,
         ban_reason: str = None,
@@ -48,25 +60,27 @@ class Cluster:
         cert_privkey: str = None,
         cert_expiry: str = None
     ):
-        result = await cdb.edit_cluster(
+        result = await cluster_registry.edit_cluster(
             self.id,
-            name,
-            secret,
-            bandwidth,
-            measureBandwidth,
-            trust,
-            isBanned,
-            ban_reason,
-            host,
-            port,
-            version,
-            runtime,
-            cert_fullchain,
-            cert_privkey,
-            cert_expiry
+            name=name,
+            secret=secret,
+            bandwidth=bandwidth,
+            measureBandwidth=measureBandwidth,
+            measureBandwidthP10=measureBandwidthP10,
+            trust=trust,
+            isBanned=isBanned,
+            ban_reason=ban_reason,
+            host=host,
+            port=port,
+            version=version,
+            runtime=runtime,
+            cert_fullchain=cert_fullchain,
+            cert_privkey=cert_privkey,
+            cert_expiry=cert_expiry,
         )
         if result:
-            await self.initialize()
+            await self.initialize()  # 从内存缓存中重新读取，不再访问数据库
+            oclm.update(self)
         return result
 
     def json(self):
@@ -76,6 +90,7 @@ class Cluster:
             "secret": self.secret,
             "bandwidth": self.bandwidth,
             "measureBandwidth": self.measureBandwidth,
+            "measureBandwidthP10": self.measureBandwidthP10,
             "trust": self.trust,
             "isBanned": self.isBanned,
             "ban_reason": self.ban_reason,
@@ -86,23 +101,282 @@ class Cluster:
         }
 
 
+# 滑动窗口吞吐量统计，数据来自节点 keep-alive 上报的 hits 与 bytes
+class RateTracker:
+    def __init__(self, window: float = 300, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.samples = deque()  # (时间, hits, bytes)
+        self.hits = 0
+        self.bytes = 0
+        self.redirects = deque()  # [秒, 重定向次数]，按秒合并
+        self.issued = 0  # 窗口内分配给该节点的重定向次数
+
+    def evict(self, now: float):
+        while self.samples and self.samples[0][0] < now - self.window:
+            _, hits, size = self.samples.popleft()
+            self.hits -= hits
+            self.bytes -= size
+        while self.redirects and self.redirects[0][0] < now - self.window:
+            self.issued -= self.redirects.popleft()[1]
+
+    def record(self, hits: int, size: int, now: float | None = None):
+        now = self.clock() if now is None else now
+        self.samples.append((now, hits, size))
+        self.hits += hits
+        self.bytes += size
+        self.evict(now)
+
+    def assign(self, now: float | None = None):
+        second = int(self.clock() if now is None else now)
+        if self.redirects and self.redirects[-1][0] == second:
+            self.redirects[-1][1] += 1
+        else:
+            self.redirects.append([second, 1])
+        self.issued += 1
+
+    # 窗口内已重定向但节点尚未上报完成的请求数；节点过载时请求积压，该值持续增长，
+    # 客户端放弃的重定向最多在窗口内被计入
+    def outstanding(self, now: float | None = None) -> int:
+        self.evict(self.clock() if now is None else now)
+        return max(self.issued - self.hits, 0)
+
+    # 估算当前每秒字节数：窗口内上报的流量加上未完成请求的预计流量
+    def rate(self, now: float | None = None) -> float:
+        outstanding = self.outstanding(now)
+        per_hit = self.bytes / self.hits if self.hits else 0
+        return (self.bytes + outstanding * per_hit) / self.window
+
+    # 积压程度：未完成请求数相对窗口内完成请求数的比例，与节点的实际吞吐量相关，
+    # 不依赖可能不准确的声明带宽
+    def backlog(self, now: float | None = None) -> float:
+        return self.outstanding(now) / max(self.hits, 1)
+
+class LoadTracker:
+    def __init__(self, window: float = 300, clock=time.monotonic):
+        self.window = window
+        self.clock = clock  # 返回当前时间（秒）的函数，仿真时可替换
+        self.trackers = {}  # cluster_id -> RateTracker
+
+    def get(self, cluster_id: str) -> RateTracker:
+        tracker = self.trackers.get(cluster_id)
+        if tracker is None:
+            tracker = self.trackers[cluster_id] = RateTracker(self.window, self.clock)
+        return tracker
+
+    def record(self, cluster_id: str, hits: int, size: int):
+        self.get(cluster_id).record(hits, size)
+
+    def remove(self, cluster_id: str):
+        self.trackers.pop(cluster_id, None)
+
+    # 负载 = 估算吞吐量 / 节点容量（优先使用测量带宽，单位 Mbps）+ 积压程度；
+    # 声明带宽高于实际容量的节点会积压请求，由后一项体现
+    def load(self, cluster: "Cluster") -> float:
+        capacity = (cluster.measureBandwidth or cluster.bandwidth or 1) * 125000
+        tracker = self.get(cluster.id)
+        return tracker.rate() / capacity + tracker.backlog()
+
+
+loads = LoadTracker(float(config.get("scheduler.window", 300)))
+
+
+# 加权一致性哈希环：每个节点按权重拥有若干虚拟节点，文件 HASH 映射到环上顺时针的前几个节点
+# 虚拟节点的位置由 "节点ID#序号" 决定，权重变化时只增删差额部分
+class HashRing:
+    def __init__(self, unit: float = 10, max_vnodes: int = 1000):
+        self.unit = unit  # 每个虚拟节点对应的权重
+        self.max_vnodes = max_vnodes
+        self.points = []  # 有序的虚拟节点位置
+        self.owners = []  # 与 points 一一对应的节点 ID
+        self.vnodes = {}  # 节点 ID -> 虚拟节点数量
+
+    @staticmethod
+    def point(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def set_node(self, node_id: str, weight: float):
+        target = 0 if weight <= 0 else min(max(round(weight / self.unit), 1), self.max_vnodes)
+        current = self.vnodes.get(node_id, 0)
+        for i in range(current, target):
+            point = self.point(f"{node_id}#{i}")
+            index = bisect.bisect_left(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node_id)
+        for i in range(target, current):
+            point = self.point(f"{node_id}#{i}")
+            index = bisect.bisect_left(self.points, point)
+            while self.owners[index] != node_id:
+                index += 1
+            del self.points[index]
+            del self.owners[index]
+        if target:
+            self.vnodes[node_id] = target
+        else:
+            self.vnodes.pop(node_id, None)
+
+    def remove_node(self, node_id: str):
+        self.set_node(node_id, 0)
+
+    # 返回 key 在环上顺时针遇到的前 count 个不同节点
+    def lookup(self, key: str, count: int = 1) -> list:
+        result = []
+        if not self.points:
+            return result
+        count = min(count, len(self.vnodes))
+        start = bisect.bisect(self.points, self.point(key))
+        for offset in range(len(self.points)):
+            owner = self.owners[(start + offset) % len(self.points)]
+            if owner not in result:
+                result.append(owner)
+                if len(result) >= count:
+                    break
+        return result
+
+
+ring = HashRing(float(config.get("scheduler.ring_unit", 10)))
+hash_replicas = int(config.get("scheduler.replicas", 3))
+
+
+# 树状数组，维护各槽位权重的前缀和，用于 O(log n) 的加权随机抽样
+class FenwickTree:
+    def __init__(self, size: int = 0):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.values = [0] * size
+        self.total = 0
+
+    def grow(self, size: int):
+        self.values.extend([0] * (size - self.size))
+        self.size = size
+        self.tree = [0] * (size + 1)
+        for i, value in enumerate(self.values, start=1):
+            self.tree[i] += value
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def set(self, index: int, value: int):
+        delta = value - self.values[index]
+        self.values[index] = value
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    # 返回前缀和大于 target 的最小下标
+    def find(self, target: int) -> int:
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+# 在线节点索引：字典维护成员关系并持有已加载的 Cluster，树状数组按权重抽样
 class OCLManager:
     def __init__(self):
-        self.list = []
+        self.clusters = {}  # cluster_id -> Cluster
+        self.slots = {}  # cluster_id -> 槽位
+        self.ids = []  # 槽位 -> cluster_id
+        self.free = []  # 空闲槽位
+        self.weights = FenwickTree()
 
     def __len__(self):
-        return len(self.list)
+        return len(self.clusters)
+
+    @property
+    def list(self):
+        return list(self.clusters)
 
-    def append(self, cluster_id: str):
-        if cluster_id not in self.list:
-            self.list.append(cluster_id)
+    @staticmethod
+    def weight_of(cluster: Cluster) -> int:
+        return max(int(cluster.weight), 1)
+
+    def append(self, cluster: Cluster):
+        if cluster.id in self.clusters:
+            self.update(cluster)
+            return
+        if self.free:
+            slot = self.free.pop()
+            self.ids[slot] = cluster.id
+        else:
+            slot = len(self.ids)
+            self.ids.append(cluster.id)
+            if slot >= self.weights.size:
+                self.weights.grow(max(slot + 1, self.weights.size * 2))
+        self.clusters[cluster.id] = cluster
+        self.slots[cluster.id] = slot
+        self.weights.set(slot, self.weight_of(cluster))
+        wrrs.add_server(cluster.id, self.weight_of(cluster))
+        ring.set_node(cluster.id, self.weight_of(cluster))
 
     def remove(self, cluster_id: str):
-        if cluster_id in self.list:
-            self.list.remove(cluster_id)
+        if cluster_id in self.clusters:
+            slot = self.slots.pop(cluster_id)
+            del self.clusters[cluster_id]
+            self.weights.set(slot, 0)
+            self.ids[slot] = None
+            self.free.append(slot)
+            wrrs.remove_server(cluster_id)
+            ring.remove_node(cluster_id)
+            loads.remove(cluster_id)
+
+    # 节点信息（如权重）变化后刷新索引
+    def update(self, cluster: Cluster):
+        if cluster.id in self.clusters:
+            self.clusters[cluster.id] = cluster
+            self.weights.set(self.slots[cluster.id], self.weight_of(cluster))
+            wrrs.update_weight(cluster.id, self.weight_of(cluster))
+            ring.set_node(cluster.id, self.weight_of(cluster))
 
     def include(self, cluster_id: str):
-        return cluster_id in self.list
+        return cluster_id in self.clusters
+
+    def get(self, cluster_id: str) -> Cluster | None:
+        return self.clusters.get(cluster_id)
+
+    # 按权重随机选择一个在线节点
+    def choice(self) -> Cluster | None:
+        if self.weights.total <= 0:
+            return None
+        slot = self.weights.find(random.randrange(self.weights.total))
+        return self.clusters[self.ids[slot]]
+
+    # 两次加权随机抽样，选择负载率较低的节点（power of two choices）
+    def choice_least_loaded(self) -> Cluster | None:
+        first = self.choice()
+        second = self.choice()
+        if first is None or second is None or first is second:
+            return first
+        return first if loads.load(first) <= loads.load(second) else second
+
+    # 在文件 HASH 对应的首选节点中选择负载率最低的一个
+    def choice_by_hash(self, hash: str) -> Cluster | None:
+        candidates = [self.clusters[i] for i in ring.lookup(hash, hash_replicas)]
+        if not candidates:
+            return None
+        return min(candidates, key=loads.load)
+
+    # 按配置的调度策略选择用于重定向的节点，hash 策略需要提供文件 HASH
+    def select(self, hash: str | None = None) -> Cluster | None:
+        if scheduler_policy == "hash" and hash is not None:
+            cluster = self.choice_by_hash(hash)
+        elif scheduler_policy == "random":
+            cluster = self.choice()
+        elif scheduler_policy == "p2c":
+            cluster = self.choice_least_loaded()
+        else:
+            cluster_id = wrrs.next_server()
+            cluster = None if cluster_id is None else self.clusters[cluster_id]
+        if cluster is not None:
+            loads.get(cluster.id).assign()
+        return cluster
 
 
 oclm = OCLManager()
@@ -222,41 +496,349 @@ class Avro:
         return r
 
 
+# 单字节 VarInt 的预计算结果（zigzag 编码后小于 128 的值）
+_SMALL_VARINTS = [bytes((i,)) for i in range(128)]
+_SHORT = struct.Struct(">H")
+_INTEGER = struct.Struct(">I")
+_LONG = struct.Struct(">q")
+
+
+def encodeVarInt(value: int) -> bytes:
+    value = (value << 1) ^ (value >> 63)
+    if value < 0x80:
+        return _SMALL_VARINTS[value]
+    result = [(value & 0x7F) | 0x80]
+    value >>= 7
+    while value > 0x7F:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+# 基于预分配 bytearray 的 Avro 编码器，与 Avro 类的输出逐字节一致
+class AvroEncoder:
+    def __init__(self, capacity: int = 65536, encoding: str = "utf-8") -> None:
+        self.buffer = bytearray(capacity)
+        self.pos = 0
+        self.encoding = encoding
+
+    def reserve(self, size: int):
+        required = self.pos + size
+        if required > len(self.buffer):
+            capacity = max(required, len(self.buffer) * 2)
+            self.buffer.extend(bytes(capacity - len(self.buffer)))
+
+    def write(self, value: bytes | int):
+        if isinstance(value, int):
+            value = bytes([value & 0xFF])
+        size = len(value)
+        self.reserve(size)
+        self.buffer[self.pos : self.pos + size] = value
+        self.pos += size
+
+    def writeBoolean(self, value: bool):
+        self.write(1 if value else 0)
+
+    def writeShort(self, data: int):
+        self.reserve(2)
+        _SHORT.pack_into(self.buffer, self.pos, data & 0xFFFF)
+        self.pos += 2
+
+    def writeInteger(self, data: int):
+        self.reserve(4)
+        _INTEGER.pack_into(self.buffer, self.pos, data & 0xFFFFFFFF)
+        self.pos += 4
+
+    def writeLong(self, data: int):
+        self.reserve(8)
+        _LONG.pack_into(
+            self.buffer, self.pos, data - 2**64 if data > 2**63 - 1 else data
+        )
+        self.pos += 8
+
+    def writeVarInt(self, value: int):
+        self.write(encodeVarInt(value))
+
+    def writeString(self, data: str, encoding: Optional[str] = None):
+        raw = data.encode(encoding or self.encoding)
+        self.write(encodeVarInt(len(raw)) + raw)
+
+    # 一次性编码一批文件记录（路径、哈希、大小、修改时间），返回记录数
+    def writeFiles(self, files):
+        chunks = []
+        append = chunks.append
+        encoding = self.encoding
+        prefixes = {}
+        count = 0
+        for file in files:
+            source = file["SOURCE"]
+            prefix = prefixes.get(source)
+            if prefix is None:
+                prefix = prefixes[source] = f"/{source}/".encode(encoding)
+            hash = file["HASH"].encode(encoding)
+            append(encodeVarInt(len(prefix) + len(hash)))
+            append(prefix)
+            append(hash)
+            append(encodeVarInt(len(hash)))
+            append(hash)
+            append(encodeVarInt(file["SIZE"]))
+            append(encodeVarInt(file["MTIME"]))
+            count += 1
+        self.write(b"".join(chunks))
+        return count
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buffer[: self.pos])
+
+    # 取出已编码的数据并清空缓冲区，便于分块输出
+    def flush(self) -> bytes:
+        result = self.getvalue()
+        self.pos = 0
+        return result
+
+    def __len__(self) -> int:
+        return self.pos
+
+
+# 从 buffer 的 pos 处读取一个 zigzag VarInt，返回 (值, 新位置)；数据不完整时抛出 EOFError
+def decodeVarInt(buffer, pos: int, end: int):
+    n = 0
+    shift = 0
+    while True:
+        if pos >= end:
+            raise EOFError()
+        b = buffer[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return (n >> 1) ^ -(n & 1), pos
+        shift += 7
+
+
+# 支持分块输入的 Avro 解码器，数据不完整时回退到记录起点等待后续数据；
+# 通过 memoryview 按下标直接解码，已消费的数据超过阈值后才整理缓冲区
+class AvroDecoder:
+    def __init__(
+        self,
+        initial_bytes: bytes = b"",
+        encoding: str = "utf-8",
+        compact_threshold: int = 1024 * 1024,
+    ) -> None:
+        self.buffer = bytearray(initial_bytes)
+        self.pos = 0
+        self.encoding = encoding
+        self.compact_threshold = compact_threshold
+        self.remaining = None  # 当前数据块中尚未读取的记录数
+        self.done = False
+
+    def feed(self, data: bytes):
+        # 已消费部分超过阈值且占缓冲区一半以上时再删除，每个字节最多被移动常数次
+        if self.pos >= self.compact_threshold and self.pos * 2 >= len(self.buffer):
+            del self.buffer[: self.pos]
+            self.pos = 0
+        self.buffer += data
+
+    def read(self, size: int) -> bytes:
+        end = self.pos + size
+        if end > len(self.buffer):
+            raise EOFError()
+        with memoryview(self.buffer) as view:
+            result = view[self.pos : end].tobytes()
+        self.pos = end
+        return result
+
+    def readBoolean(self):
+        if self.pos >= len(self.buffer):
+            raise EOFError()
+        self.pos += 1
+        return self.buffer[self.pos - 1] != 0
+
+    def unpack(self, fmt: struct.Struct):
+        if self.pos + fmt.size > len(self.buffer):
+            raise EOFError()
+        value = fmt.unpack_from(self.buffer, self.pos)[0]
+        self.pos += fmt.size
+        return value
+
+    def readShort(self):
+        return self.unpack(_SHORT)
+
+    def readInteger(self):
+        return self.unpack(_INTEGER)
+
+    def readLong(self) -> int:
+        return self.unpack(_LONG)
+
+    def readVarInt(self) -> int:
+        value, self.pos = decodeVarInt(self.buffer, self.pos, len(self.buffer))
+        return value
+
+    def readString(self, encoding: Optional[str] = None) -> str:
+        length, pos = decodeVarInt(self.buffer, self.pos, len(self.buffer))
+        if pos + length > len(self.buffer):
+            raise EOFError()
+        with memoryview(self.buffer) as view:
+            result = str(view[pos : pos + length], encoding or self.encoding)
+        self.pos = pos + length
+        return result
+
+    # 解码当前缓冲区中所有已完整到达的文件记录；VarInt 在循环内直接展开，读到缓冲区末尾时
+    # 由 IndexError 判断数据不完整。持有 memoryview 期间缓冲区不能改变大小，
+    # 因此先解码成列表，释放视图后再返回
+    def decode_files(self) -> list:
+        result = []
+        if self.done:
+            return result
+        buffer = self.buffer
+        end = len(buffer)
+        pos = self.pos
+        remaining = self.remaining
+        encoding = self.encoding
+        append = result.append
+        consumed = pos  # 最后一条完整记录之后的位置
+        with memoryview(buffer) as view:
+            try:
+                while True:
+                    if remaining is None:
+                        remaining, pos = decodeVarInt(buffer, pos, end)
+                        consumed = pos
+                        if remaining == 0:
+                            self.done = True
+                            break
+                    # 路径与哈希的长度通常只占一个字节
+                    n = buffer[pos]
+                    pos += 1
+                    if n >= 0x80:
+                        n, pos = decodeVarInt(buffer, pos - 1, end)
+                    else:
+                        n = (n >> 1) ^ -(n & 1)
+                    if pos + n > end:
+                        break
+                    path = str(view[pos : pos + n], encoding)
+                    pos += n
+                    n = buffer[pos]
+                    pos += 1
+                    if n >= 0x80:
+                        n, pos = decodeVarInt(buffer, pos - 1, end)
+                    else:
+                        n = (n >> 1) ^ -(n & 1)
+                    if pos + n > end:
+                        break
+                    hash = str(view[pos : pos + n], encoding)
+                    pos += n
+                    b = buffer[pos]
+                    pos += 1
+                    n = b & 0x7F
+                    shift = 7
+                    while b & 0x80:
+                        b = buffer[pos]
+                        pos += 1
+                        n |= (b & 0x7F) << shift
+                        shift += 7
+                    size = (n >> 1) ^ -(n & 1)
+                    b = buffer[pos]
+                    pos += 1
+                    n = b & 0x7F
+                    shift = 7
+                    while b & 0x80:
+                        b = buffer[pos]
+                        pos += 1
+                        n |= (b & 0x7F) << shift
+                        shift += 7
+                    append(
+                        {
+                            "path": path,
+                            "hash": hash,
+                            "size": size,
+                            "mtime": (n >> 1) ^ -(n & 1),
+                        }
+                    )
+                    consumed = pos
+                    remaining -= 1
+                    if remaining == 0:
+                        remaining = None
+            except (EOFError, IndexError):
+                pass
+        self.pos = consumed
+        self.remaining = remaining
+        return result
+
+    # 逐条产出已完整到达的文件记录，读到结束标记 0 后停止
+    def files(self):
+        while True:
+            records = self.decode_files()
+            if not records:
+                return
+            yield from records
+
+# 步幅调度（stride scheduling）实现的平滑加权轮询：
+# 每个节点的步幅与权重成反比，每次选出 pass 值最小的节点并使其前进一个步幅
+# 堆中只保存每个节点的一个有效条目，更新与删除通过版本号惰性淘汰旧条目
 class WRRScheduler:
+    STRIDE = 1 << 20
+
     def __init__(self):
-        self.servers = {}
-        self.queue = []
+        self.servers = {}  # server -> 权重
+        self.passes = {}  # server -> 当前 pass 值
+        self.versions = {}  # server -> 有效条目的版本号
+        self.queue = []  # (pass, 序号, 版本号, server)
+        self.counter = 0
+        self.vtime = 0.0  # 最近一次选中节点的 pass 值，新节点从此处开始
+
+    def push(self, server):
+        self.counter += 1
+        self.versions[server] = self.counter
+        heapq.heappush(
+            self.queue, (self.passes[server], self.counter, self.counter, server)
+        )
+        # 过期条目过多时压缩堆
+        if len(self.queue) > 2 * len(self.servers) + 64:
+            self.queue = [
+                item for item in self.queue if self.versions.get(item[3]) == item[2]
+            ]
+            heapq.heapify(self.queue)
 
     def add_server(self, server, weight):
-        # 添加服务器及其权重到字典
-        self.servers[server] = weight
-        # 向队列中添加多个条目，数量由权重决定
-        for _ in range(weight):
-            heapq.heappush(self.queue, (-weight, server))
+        if server in self.servers:
+            self.update_weight(server, weight)
+            return
+        self.servers[server] = max(weight, 1)
+        self.passes[server] = self.vtime + self.STRIDE / self.servers[server]
+        self.push(server)
 
     def remove_server(self, server):
-        # 移除所有与指定服务器相关的条目
-        self.queue = [item for item in self.queue if item[1] != server]
-        # 从字典中删除服务器
-        del self.servers[server]
+        if server in self.servers:
+            del self.servers[server]
+            del self.passes[server]
+            del self.versions[server]
 
     def update_weight(self, server, new_weight):
-        # 移除所有与指定服务器相关的条目
-        self.queue = [item for item in self.queue if item[1] != server]
-        # 更新字典中的权重
+        if server not in self.servers:
+            self.add_server(server, new_weight)
+            return
+        new_weight = max(new_weight, 1)
+        # 按新旧步幅的比例缩放剩余距离，使新权重立即生效
+        remain = max(self.passes[server] - self.vtime, 0)
+        self.passes[server] = self.vtime + remain * self.servers[server] / new_weight
         self.servers[server] = new_weight
-        # 添加新的条目
-        for _ in range(new_weight):
-            heapq.heappush(self.queue, (-new_weight, server))
+        self.push(server)
 
     def next_server(self):
-        if not self.queue:
-            return None
-        # 弹出队列中的第一个元素
-        weight, server = heapq.heappop(self.queue)
-        # 将权重减一后重新插入队列
-        heapq.heappush(self.queue, (weight + 1, server))
-        return server
+        while self.queue:
+            pass_value, _, version, server = self.queue[0]
+            if self.versions.get(server) != version:
+                heapq.heappop(self.queue)
+                continue
+            self.vtime = pass_value
+            self.passes[server] = pass_value + self.STRIDE / self.servers[server]
+            self.counter += 1
+            self.versions[server] = self.counter
+            heapq.heapreplace(
+                self.queue, (self.passes[server], self.counter, self.counter, server)
+            )
+            return server
+        return None
 
 
 wrrs = WRRScheduler()
@@ -0,0 +1,249 @@
+# 第三方库
+import os
+import httpx
+import asyncio
+import hashlib
+from fastapi import HTTPException
+from collections import OrderedDict
+
+# 本地库
+import core.const as const
+from core.config import config
+from core.logger import logger
+
+
+# 一次正在进行的上游拉取，数据先写入临时文件，等待者边写边读
+class Fetch:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.size = size
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.condition = asyncio.Condition()
+        self.task = None
+
+    async def notify(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+
+# 上游拉取缓存：不在本地的文件从 URL 拉取一次后按 HASH 存盘，
+# 同一文件的并发请求合并为一次上游请求，缓存按总大小进行 LRU 淘汰
+class UpstreamCache:
+    def __init__(
+        self,
+        directory: str = "./data/upstream",
+        max_size: int = 10 * 1024 * 1024 * 1024,
+        timeout: float = 30,
+        chunk_size: int = 256 * 1024,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.entries = OrderedDict()  # HASH -> 文件大小，按最近使用排序
+        self.total = 0
+        self.inflight = {}  # HASH -> Fetch
+        self.client = None
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evicted = 0
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                headers={"User-Agent": const.user_agent},
+                timeout=httpx.Timeout(self.timeout),
+                follow_redirects=True,
+            )
+        return self.client
+
+    async def close(self):
+        for fetch in list(self.inflight.values()):
+            fetch.task.cancel()
+        await asyncio.gather(
+            *[fetch.task for fetch in self.inflight.values()], return_exceptions=True
+        )
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def path_of(self, hash: str) -> str:
+        return os.path.join(self.directory, hash[:2], hash)
+
+    # 扫描缓存目录重建索引，按访问时间从旧到新排列
+    def load(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)  # 上次退出时未完成的下载
+                    continue
+                stat = os.stat(path)
+                files.append((stat.st_atime, name, stat.st_size))
+        for _, hash, size in sorted(files):
+            self.entries[hash] = size
+            self.total += size
+        logger.debug(f"上游缓存已加载 {len(self.entries)} 个文件，共 {self.total} 字节")
+
+    def add(self, hash: str, size: int):
+        self.entries[hash] = size
+        self.total += size
+        while self.total > self.max_size and len(self.entries) > 1:
+            old_hash, old_size = self.entries.popitem(last=False)
+            self.total -= old_size
+            self.evicted += 1
+            try:
+                os.remove(self.path_of(old_hash))
+            except OSError as e:
+                logger.warning(f"删除上游缓存 {old_hash} 失败: {e}")
+
+    # 已缓存时返回本地路径并标记为最近使用
+    def lookup(self, hash: str) -> str | None:
+        if hash not in self.entries:
+            return None
+        path = self.path_of(hash)
+        if not os.path.exists(path):
+            self.total -= self.entries.pop(hash)
+            return None
+        self.entries.move_to_end(hash)
+        self.hits += 1
+        return path
+
+    def verify(self, hash: str, digest) -> bool:
+        return len(hash) not in (32, 40) or digest.hexdigest() == hash
+
+    def write_chunk(self, f, chunk: bytes):
+        f.write(chunk)
+        f.flush()  # 让读取临时文件的等待者能立即读到
+
+    # 打开正在写入的临时文件；下载恰好完成时临时文件已被重命名，改为打开最终文件
+    def open_fetch(self, fetch: Fetch):
+        try:
+            return open(fetch.temp_path, "rb")
+        except FileNotFoundError:
+            if fetch.done and fetch.error is None:
+                return open(fetch.path, "rb")
+            raise
+
+    async def download(self, hash: str, url: str, fetch: Fetch):
+        digest = hashlib.sha1() if len(hash) == 40 else hashlib.md5()
+        try:
+            os.makedirs(os.path.dirname(fetch.temp_path), exist_ok=True)
+            with open(fetch.temp_path, "wb") as f:
+                async with self.get_client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():  # 不缓冲，收到即转发
+                        await asyncio.to_thread(self.write_chunk, f, chunk)
+                        digest.update(chunk)
+                        fetch.written += len(chunk)
+                        await fetch.notify()
+            if fetch.size and fetch.written != fetch.size:
+                raise ValueError(f"大小不符: 收到 {fetch.written}B，应为 {fetch.size}B")
+            if not self.verify(hash, digest):
+                raise ValueError("哈希校验失败")
+            os.replace(fetch.temp_path, fetch.path)
+            self.add(hash, fetch.written)
+            logger.debug(f"已从上游缓存 {hash} ({fetch.written}B)")
+        except BaseException as e:
+            fetch.error = e
+            logger.warning(f"从上游拉取 {hash} 失败: {repr(e)}")
+            try:
+                os.remove(fetch.temp_path)
+            except OSError:
+                pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            fetch.done = True
+            self.inflight.pop(hash, None)
+            await fetch.notify()
+
+    # 从正在写入的临时文件中读取数据，追上写入进度时等待
+    async def follow(self, fetch: Fetch):
+        async with fetch.condition:
+            await fetch.condition.wait_for(lambda: fetch.written > 0 or fetch.done)
+        if fetch.error is not None:
+            raise fetch.error
+        f = await asyncio.to_thread(self.open_fetch, fetch)
+        try:
+            position = 0
+            while True:
+                if position < fetch.written:
+                    chunk = await asyncio.to_thread(
+                        f.read, min(self.chunk_size, fetch.written - position)
+                    )
+                    position += len(chunk)
+                    yield chunk
+                    continue
+                if fetch.done:
+                    if fetch.error is not None:
+                        raise fetch.error
+                    return
+                async with fetch.condition:
+                    await fetch.condition.wait_for(
+                        lambda: fetch.written > position or fetch.done
+                    )
+        finally:
+            await asyncio.to_thread(f.close)
+
+    # 等到上游返回第一块数据（或成功结束）后再发送响应头，这样在此之前的失败
+    # （404、超时等）返回 502 而不是一个被截断的 200；之后的失败（大小或哈希不符）
+    # 只能中断连接，客户端可通过 Content-Length 发现数据不完整
+    async def prime(self, stream):
+        try:
+            first = await anext(stream, None)
+        except Exception as e:
+            await stream.aclose()
+            raise HTTPException(502, detail=f"从上游获取文件失败: {e}")
+
+        async def chained():
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+        return chained()
+
+    # 获取文件：已缓存时返回本地路径，否则返回边拉取边产出数据的异步迭代器
+    def open(self, hash: str, url: str, size: int = 0):
+        path = self.lookup(hash)
+        if path is not None:
+            return path
+        fetch = self.inflight.get(hash)
+        if fetch is None:
+            self.misses += 1
+            fetch = Fetch(self.path_of(hash), size)
+            fetch.task = asyncio.create_task(self.download(hash, url, fetch))
+            self.inflight[hash] = fetch
+        else:
+            self.coalesced += 1
+        return self.follow(fetch)
+
+    def metrics(self):
+        return {
+            "files": len(self.entries),
+            "size": self.total,
+            "maxSize": self.max_size,
+            "inflight": len(self.inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+        }
+
+
+upstream_cache = UpstreamCache(
+    config.get("upstream.directory", "./data/upstream"),
+    int(float(config.get("upstream.max_size", 10240)) * 1024 * 1024),
+    float(config.get("upstream.timeout", 30)),
+    int(config.get("upstream.chunk_size", 256 * 1024)),
+)
@@ -73,21 +73,3 @@ def get_sign(path, secret):
 def get_url(host: str, port: str, path: str, sign: str):
     url = f"https://{host}:{port}{path}{sign}"
     return url
-
-
-# 对节点进行测速
-async def measure_cluster(size: int, cluster: Cluster):
-    path = f"/measure/{str(size)}"
-    sign = get_sign(path, cluster.secret)
-    url = get_url(cluster.host, cluster.port, path, sign)
-    try:
-        start_time = time.time()
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers={"User-Agent": const.user_agent})
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        # 计算测速时间
-        bandwidth = size / elapsed_time * 8  # 计算带宽
-        return [True, bandwidth]
-    except Exception as e:
-        return [False, e]
@@ -13,4 +13,6 @@ if py_version < (3, 11):
     sys.exit(1)
 
 
-core.init()  # 初始化
+# 证书服务的进程池使用 spawn，子进程会重新导入本模块，不能在导入时启动服务
+if __name__ == "__main__":
+    core.init()  # 初始化
@@ -0,0 +1,144 @@
+# AvroEncoder / AvroDecoder 与原 Avro 类的往返测试
+# 用法: python -m pytest -q test_avro.py 或 python test_avro.py
+import random
+
+from core.types import Avro, AvroEncoder, AvroDecoder, encodeVarInt
+
+VARINTS = [
+    0, 1, -1, 2, -2, 63, -64, 64, -65, 127, 128, -128, -129, 300, -300,
+    2**31 - 1, -(2**31), 2**32, 2**53, -(2**53), 2**62, 2**63 - 1, -(2**63),
+]
+STRINGS = ["", "a", "hello", "路径/文件.txt", "🎉" * 3, "x" * 200, "a\x00b"]
+
+
+def make_files(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "HASH": "%040x" % rng.getrandbits(160),
+            "SOURCE": rng.choice(["local", "upstream", "目录"]),
+            "SIZE": rng.choice([0, 1, 127, 128, rng.randint(0, 2**40)]),
+            "MTIME": rng.randint(0, 2**45),
+        }
+        for _ in range(count)
+    ]
+
+
+# 原 get_filesList 使用 Avro 类逐字段写出的文件列表
+def encode_with_avro(files: list) -> bytes:
+    avro = Avro()
+    avro.writeVarInt(len(files))
+    for file in files:
+        avro.writeString(f"/{file['SOURCE']}/{file['HASH']}")
+        avro.writeString(file["HASH"])
+        avro.writeVarInt(file["SIZE"])
+        avro.writeVarInt(file["MTIME"])
+    avro.writeVarInt(0)
+    return avro.io.getvalue()
+
+
+def encode_with_encoder(files: list) -> bytes:
+    encoder = AvroEncoder(capacity=16)  # 容量很小，覆盖扩容路径
+    encoder.writeVarInt(len(files))
+    encoder.writeFiles(files)
+    encoder.writeVarInt(0)
+    return encoder.getvalue()
+
+
+def expected_records(files: list) -> list:
+    return [
+        {
+            "path": f"/{file['SOURCE']}/{file['HASH']}",
+            "hash": file["HASH"],
+            "size": file["SIZE"],
+            "mtime": file["MTIME"],
+        }
+        for file in files
+    ]
+
+
+def test_varint():
+    for value in VARINTS:
+        assert encodeVarInt(value) == Avro.getVarInt(value), value
+        encoder = AvroEncoder()
+        encoder.writeVarInt(value)
+        assert encoder.getvalue() == Avro.getVarInt(value)
+        assert AvroDecoder(encoder.getvalue()).readVarInt() == value
+        assert Avro(encoder.getvalue()).readVarInt() == value
+
+
+def test_fixed_width():
+    for value in [0, 1, 255, 256, 65535, -1, 2**31, 2**63 - 1, -(2**63)]:
+        avro, encoder = Avro(), AvroEncoder()
+        for target in (avro, encoder):
+            target.writeShort(value)
+            target.writeInteger(value)
+            target.writeLong(value)
+            target.writeBoolean(bool(value))
+        assert encoder.getvalue() == avro.io.getvalue(), value
+        decoder = AvroDecoder(encoder.getvalue())
+        assert decoder.readShort() == value & 0xFFFF
+        assert decoder.readInteger() == value & 0xFFFFFFFF
+        assert decoder.readLong() == Avro(encoder.getvalue()[6:]).readLong()
+        assert decoder.readBoolean() == bool(value)
+
+
+def test_string():
+    for value in STRINGS:
+        avro, encoder = Avro(), AvroEncoder()
+        avro.writeString(value)
+        encoder.writeString(value)
+        assert encoder.getvalue() == avro.io.getvalue(), value
+        assert AvroDecoder(encoder.getvalue()).readString() == value
+        assert Avro(encoder.getvalue()).readString() == value
+
+
+def test_filelist():
+    for count in (0, 1, 1000):
+        files = make_files(count, seed=count)
+        data = encode_with_encoder(files)
+        assert data == encode_with_avro(files)
+        decoder = AvroDecoder(data)
+        assert list(decoder.files()) == expected_records(files)
+        assert decoder.done
+
+
+# 按任意大小切块输入，结果与一次性输入一致，且不完整的记录不会被提前产出；
+# 较小的整理阈值覆盖缓冲区整理的路径
+def test_chunked_feed():
+    files = make_files(500, seed=1)
+    data = encode_with_encoder(files)
+    rng = random.Random(2)
+    for max_chunk, threshold in ((1, 16), (7, 1024 * 1024), (64, 100), (4096, 0)):
+        decoder = AvroDecoder(compact_threshold=threshold)
+        records = []
+        pos = 0
+        while pos < len(data):
+            size = rng.randint(1, max_chunk)
+            decoder.feed(data[pos : pos + size])
+            pos += size
+            records.extend(decoder.files())
+            assert decoder.done == (pos >= len(data))
+        assert records == expected_records(files), max_chunk
+        assert len(decoder.buffer) < len(data) or threshold >= len(data)
+
+
+def test_flush():
+    files = make_files(100, seed=3)
+    encoder = AvroEncoder()
+    encoder.writeVarInt(len(files))
+    parts = []
+    for i in range(0, len(files), 30):
+        encoder.writeFiles(files[i : i + 30])
+        parts.append(encoder.flush())
+    encoder.writeVarInt(0)
+    parts.append(encoder.flush())
+    assert len(encoder) == 0
+    assert b"".join(parts) == encode_with_avro(files)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name} 通过")